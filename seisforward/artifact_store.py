@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+Content-addressed store of shared files(specfem binary, mesher
+outputs, model files) under the runbase. Each file is hashed once and
+kept as a single read-only copy in the store; job and event
+directories get hardlinks(or symlinks) to it, falling back to copies
+only when linking is not possible(for example, across filesystems).
+"""
+from __future__ import print_function, division, absolute_import
+import os
+import stat
+import errno
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from . import metrics
+
+
+# link modes of the store: "copy" is the same as not using the store
+STORE_MODES = ["hardlink", "symlink", "copy"]
+
+# store directory, under runbase
+ARTIFACT_STORE_DIR = "artifact_store"
+
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def hash_file(path, block_size=HASH_BLOCK_SIZE):
+    """ sha1 of file content, read in blocks """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as fh:
+        while True:
+            block = fh.read(block_size)
+            if not block:
+                break
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class ArtifactStore(object):
+    """
+    Files are stored as "objects/<hash[:2]>/<hash[2:]>", read-only(
+    executable bits are kept). Hashes are cached by (path, size,
+    mtime), so each source file is hashed once per process.
+    """
+    def __init__(self, root, mode="hardlink"):
+        if mode not in STORE_MODES:
+            raise ValueError("Unknown artifact store mode(%s), should be "
+                             "one of %s" % (mode, STORE_MODES))
+        self.root = root
+        self.mode = mode
+        self.lock = threading.Lock()
+        # workers of one process add objects one by one, so a file is
+        # not copied into the store several times
+        self.add_lock = threading.Lock()
+        self.hashes = {}
+
+    def get_object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest[2:])
+
+    def get_digest(self, path):
+        st = os.stat(path)
+        key = (os.path.realpath(path), st.st_size, st.st_mtime)
+        with self.lock:
+            digest = self.hashes.get(key)
+        if digest is None:
+            with metrics.timer("store.hash"):
+                digest = hash_file(path)
+            with self.lock:
+                self.hashes[key] = digest
+        return digest
+
+    def add(self, path):
+        """ Add file into the store(if not yet), returns the object path """
+        digest = self.get_digest(path)
+        object_path = self.get_object_path(digest)
+        if os.path.exists(object_path):
+            return object_path
+        with self.add_lock:
+            if not os.path.exists(object_path):
+                self._add_object(path, object_path)
+        return object_path
+
+    def _add_object(self, path, object_path):
+        dirname = os.path.dirname(object_path)
+        try:
+            os.makedirs(dirname)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+        # copy to a temporary file first, so the object appears
+        # atomically(also if added by several workers at the same time)
+        fd, tmpfile = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+        os.close(fd)
+        try:
+            with metrics.timer("file.copy"):
+                shutil.copyfile(path, tmpfile)
+            exec_bits = os.stat(path).st_mode & \
+                (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+            os.chmod(tmpfile, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH |
+                     exec_bits)
+            os.rename(tmpfile, object_path)
+        except Exception:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            raise
+        metrics.count("store.objects")
+
+    def place(self, path, target):
+        """
+        Place file at target, as a link to the object in the store(or a
+        copy if mode is "copy" or linking fails). Returns how it was
+        placed: "hardlink", "symlink" or "copy".
+        """
+        if os.path.lexists(target):
+            os.remove(target)
+
+        if self.mode != "copy":
+            object_path = self.add(path)
+            try:
+                if self.mode == "hardlink":
+                    os.link(object_path, target)
+                else:
+                    os.symlink(os.path.abspath(object_path), target)
+                metrics.count("store.%s" % self.mode)
+                metrics.count("store.bytes_saved",
+                              os.stat(object_path).st_size)
+                return self.mode
+            except OSError as exc:
+                # cross-device, too many links or not supported
+                print("Failed to %s %s(%s), copy instead"
+                      % (self.mode, target, exc))
+
+        with metrics.timer("file.copy"):
+            shutil.copy2(path, target)
+        metrics.count("store.copy")
+        return "copy"
+
+
+def get_artifact_store(runbase_info):
+    """
+    Artifact store of the runbase, if "artifact_store_mode" is set in
+    config runbase_info(otherwise None, and files are copied)
+    """
+    mode = runbase_info.get("artifact_store_mode")
+    if mode is None:
+        return None
+    root = os.path.join(runbase_info["runbase"], ARTIFACT_STORE_DIR)
+    return ArtifactStore(root, mode=mode)
+
+
+def place_file(store, path, target):
+    """ Place file at target through the store, or copy if no store """
+    if store is None:
+        # never write through a link into the store(if the target was
+        # placed by a store before, as a hardlink or symlink)
+        if os.path.lexists(target):
+            os.remove(target)
+        with metrics.timer("file.copy"):
+            shutil.copy(path, target)
+        metrics.count("file.copy.files")
+    else:
+        store.place(path, target)
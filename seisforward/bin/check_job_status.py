@@ -3,20 +3,29 @@ from __future__ import print_function, division, absolute_import
 import argparse
 from seisforward.io import load_config
 from seisforward.forward_manager import check_forward_job
+from seisforward.metrics import with_metrics_summary
 
 
+@with_metrics_summary
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', action='store', dest='config_file',
                         required=True, help="config yaml file")
+    parser.add_argument('--by-tag', action='store_true', dest='by_tag',
+                        help="show status counts for each tag")
+    parser.add_argument('--recount', action='store_true', dest='recount',
+                        help="count from the solver table instead of "
+                        "the cached status counts")
     args = parser.parse_args()
 
     config = load_config(args.config_file)
     simul_type = config["simulation"]["type"]
     db_name = config["runbase_info"]["db_name"]
+    db_options = config["runbase_info"].get("db_options")
 
-    if simul_type == "forward_simulation":
-        check_forward_job(db_name)
+    if simul_type in ["forward_simulation", "line_search"]:
+        check_forward_job(db_name, by_tag=args.by_tag,
+                          cached=(not args.recount), db_options=db_options)
     elif simul_type == "adjoint_simulation":
         pass
     elif simul_type == "source_inversion":
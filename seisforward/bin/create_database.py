@@ -5,34 +5,22 @@ from __future__ import print_function, division, absolute_import
 import os
 import argparse
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-from seisforward.status import Status
-from seisforward.db import Base, SolverStatus
+from seisforward.db import Base, create_db_engine, upgrade_db
 from seisforward.io import load_config
+from seisforward.metrics import with_metrics_summary
 
 
-def create_forward_db(db_name, verbose=False):
+def create_forward_db(db_name, verbose=False, db_options=None):
     """
-    Create the empty database
+    Create the empty database. Statuses are filled into the status
+    table by the schema migrations.
     """
     if os.path.exists(db_name):
         raise ValueError("Database(%s) already exists!" % (db_name))
 
-    engine = create_engine('sqlite:///%s' % db_name, echo=verbose)
+    engine = create_db_engine(db_name, db_options=db_options, echo=verbose)
     Base.metadata.create_all(engine)
-
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    statuses = Status().get_status()
-    for s in statuses:
-        statusobj = SolverStatus(name=s)
-        session.add(statusobj)
-
-    session.commit()
-    session.close()
+    upgrade_db(engine)
 
 
 def check_db_exists(db_name):
@@ -47,6 +35,7 @@ def check_db_exists(db_name):
                          % db_name)
 
 
+@with_metrics_summary
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', action='store', dest='config_file',
@@ -61,7 +50,8 @@ def main():
     db_name = config["runbase_info"]["db_name"]
 
     if stype == "forward_simulation" or "line_search":
-        create_forward_db(db_name, args.verbose)
+        create_forward_db(db_name, args.verbose,
+                          config["runbase_info"].get("db_options"))
     elif stype == "adjoint_simulation":
         check_db_exists(db_name)
 
@@ -9,17 +9,52 @@ The output job scripts will be put at "$runbase/jobs"
 1) split the eventlist
 2) create job sub-folder
 3) check specfem3d_globe integrity
+With "--plan", only the plan of forward jobs is computed and saved as
+JSON(no solver is claimed and no file is written); it could be
+executed later with "--from-plan".
+Job creation is recorded in the job journal: if it fails, unfinished
+jobs could be finished with "--resume", or rolled back(claims returned
+to "New" and job folders removed) with "--rollback".
 """
 from __future__ import print_function, division, absolute_import
 import argparse
 from seisforward.io import load_config
 from seisforward.forward_manager import ForwardSolver
+from seisforward.job_planner import print_plan, dump_plan, load_plan
+from seisforward.utils import FOLDER_EXIST_ACTIONS
 from seisforward.line_search_manager import LineSearchSolver
+from seisforward.metrics import with_metrics_summary
 
 
-def create_forward_jobs(config):
+def create_forward_jobs(config, max_jobs=None, workers=1):
     manager = ForwardSolver(config=config)
-    manager.create_jobs()
+    manager.create_jobs(max_jobs=max_jobs, workers=workers)
+
+
+def resume_forward_jobs(config, workers=1, force=False):
+    manager = ForwardSolver(config=config)
+    manager.resume_jobs(workers=workers, force=force)
+
+
+def rollback_forward_jobs(config, force=False):
+    manager = ForwardSolver(config=config)
+    manager.rollback_jobs(force=force)
+
+
+def plan_forward_jobs(config, outputfn, max_jobs=None):
+    # planning writes nothing, not even schema upgrades
+    manager = ForwardSolver(config=config, readonly=True)
+    plan = manager.plan_jobs(max_jobs=max_jobs)
+    print_plan(plan)
+    print("Output plan file: %s" % outputfn)
+    dump_plan(plan, outputfn)
+
+
+def create_forward_jobs_from_plan(planfn, workers=1, on_exist="ask"):
+    plan = load_plan(planfn)
+    print_plan(plan)
+    manager = ForwardSolver(config=plan["config"])
+    manager.create_jobs_from_plan(plan, workers=workers, on_exist=on_exist)
 
 
 def create_adjoint_jobs(config):
@@ -31,17 +66,70 @@ def create_line_search_jobs(config):
     manager.create_jobs()
 
 
+@with_metrics_summary
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', action='store', dest='config_file',
-                        required=True, help="config yaml file")
+                        default=None,
+                        help="config yaml file(not needed with --from-plan)")
+    parser.add_argument('-n', action='store', dest='max_jobs', type=int,
+                        default=None,
+                        help="max number of jobs to create(forward only)")
+    parser.add_argument('--workers', action='store', dest='workers',
+                        type=int, default=1,
+                        help="number of workers to create job folders "
+                        "concurrently(forward only)")
+    parser.add_argument('--on-exist', action='store', dest='on_exist',
+                        choices=FOLDER_EXIST_ACTIONS, default="ask",
+                        help="if job folders of the plan exist: ask, "
+                        "remove them or abort(with --from-plan)")
+    parser.add_argument('--force', action='store_true', dest='force',
+                        help="with --resume or --rollback, also take over "
+                        "claims whose lease has not expired(only if their "
+                        "job creation is not running)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--plan', action='store', dest='plan_file',
+                       default=None,
+                       help="dry run, only save the plan of jobs into this "
+                       "json file(forward only)")
+    group.add_argument('--from-plan', action='store', dest='from_plan_file',
+                       default=None,
+                       help="create the jobs of the plan json file, as "
+                       "planned(forward only)")
+    group.add_argument('--resume', action='store_true', dest='resume',
+                       help="finish the unfinished jobs in the job "
+                       "journal(forward only)")
+    group.add_argument('--rollback', action='store_true', dest='rollback',
+                       help="release the claims of the unfinished jobs in "
+                       "the job journal and remove their folders"
+                       "(forward only)")
     args = parser.parse_args()
 
+    if args.from_plan_file is not None:
+        create_forward_jobs_from_plan(args.from_plan_file,
+                                      workers=args.workers,
+                                      on_exist=args.on_exist)
+        return
+
+    if args.config_file is None:
+        parser.error("argument -c is required")
     config = load_config(args.config_file)
 
     stype = config["simulation"]["type"]
-    if stype == "forward_simulation":
-        create_forward_jobs(config)
+    if args.plan_file is not None or args.resume or args.rollback:
+        if stype != "forward_simulation":
+            raise NotImplementedError("Plan, resume and rollback not "
+                                      "implemented for: %s" % stype)
+
+    if args.plan_file is not None:
+        plan_forward_jobs(config, args.plan_file, max_jobs=args.max_jobs)
+    elif args.resume:
+        resume_forward_jobs(config, workers=args.workers, force=args.force)
+    elif args.rollback:
+        rollback_forward_jobs(config, force=args.force)
+    elif stype == "forward_simulation":
+        create_forward_jobs(config, max_jobs=args.max_jobs,
+                            workers=args.workers)
     elif stype == "adjoint_simulation":
         create_adjoint_jobs(config)
     elif stype == "line_search":
@@ -10,8 +10,10 @@ import argparse
 from seisforward.validate_config import validate_config
 from seisforward.io import load_config
 from seisforward.easy_copy_specfem import easy_copy_specfem
+from seisforward.metrics import with_metrics_summary
 
 
+@with_metrics_summary
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', action='store', dest='config_file',
@@ -24,7 +26,11 @@ def main():
     targetdir = os.path.join(config["runbase_info"]["runbase"],
                              "specfem3d_globe")
 
-    easy_copy_specfem(specfemdir, targetdir)
+    runbase_info = config["runbase_info"]
+    easy_copy_specfem(
+        specfemdir, targetdir,
+        sync_workers=runbase_info.get("model_sync_workers", 1),
+        sync_checksum=runbase_info.get("model_sync_checksum", False))
 
 
 if __name__ == "__main__":
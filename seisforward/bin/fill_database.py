@@ -1,40 +1,131 @@
 import os
 import argparse
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 
 from seisforward.status import Status
 from seisforward.db import Event, Solver
-from seisforward.io import load_config, read_txt_into_list
+from seisforward.forward_manager import create_db_connection
+from seisforward.io import load_config, iter_txt_lines
 from seisforward.validate_config import validate_config
 from seisforward.utils import get_model_perturbation_string
+from seisforward.metrics import with_metrics_summary, timed, count
 
 
-def fill_forward_db(config, verbose=False):
-    db_name = config["runbase_info"]["db_name"]
-    runbase = config["runbase_info"]["runbase"]
+# number of entries inserted by one "executemany"
+INSERT_CHUNK_SIZE = 500
 
-    cmtfolder = config["data_info"]["cmtfolder"]
-    stationfolder = config["data_info"]["stationfolder"]
 
-    print("Filling database: %s" % db_name)
-    print("=" * 20)
-    print("Runbase: %s" % runbase)
-    print("cmtfolder: %s" % cmtfolder)
-    print("stationfolder:%s" % stationfolder)
+def count_rows(conn, table):
+    return conn.execute(
+        text("SELECT COUNT(*) FROM %s" % table.name)).scalar()
 
-    eventfile = config["data_info"]["total_eventfile"]
-    events = read_txt_into_list(eventfile)
-    nevents = len(events)
-    print("eventfile: %s" % eventfile)
-    print("Number of events: %s" % nevents)
 
-    engine = create_engine('sqlite:///%s' % db_name, echo=False)
-    Session = sessionmaker(bind=engine)
-    session = Session()
+@timed("db.insert")
+def insert_entry_chunk(conn, entries):
+    """
+    Insert one chunk of entries(dict with keys eventname, cmtfile,
+    stationfile, runbase and tag). Events and solvers which already
+    exist(same eventname or runbase) are skipped. Entries whose event
+    could not be inserted(its cmtfile belongs to an event with another
+    name) are skipped as duplicates, with a warning.
+
+    Returns the number of duplicate entries skipped.
+    """
+    event_table = Event.__table__
+    solver_table = Solver.__table__
+
+    events = {}
+    for entry in entries:
+        events[entry["eventname"]] = {"eventname": entry["eventname"],
+                                      "cmtfile": entry["cmtfile"]}
+    conn.execute(event_table.insert().prefix_with("OR IGNORE"),
+                 list(events.values()))
+
+    event_ids = {}
+    query = event_table.select().where(
+        event_table.c.eventname.in_(list(events)))
+    for row in conn.execute(query):
+        event_ids[row.eventname] = row.id
+
+    solvers = []
+    status = Status().new
+    duplicates = []
+    for entry in entries:
+        if entry["eventname"] not in event_ids:
+            duplicates.append(entry)
+            continue
+        solvers.append({"stationfile": entry["stationfile"],
+                        "runbase": entry["runbase"],
+                        "status": status, "tag": entry["tag"],
+                        "event_id": event_ids[entry["eventname"]]})
+    if len(solvers) > 0:
+        conn.execute(solver_table.insert().prefix_with("OR IGNORE"),
+                     solvers)
+    for entry in duplicates:
+        print("Warning: skip %s, cmtfile already used by another event: %s"
+              % (entry["eventname"], entry["cmtfile"]))
+    count("db.insert.entries", len(entries))
+    count("db.insert.duplicates", len(duplicates))
+    return len(duplicates)
+
+
+def bulk_load_entries(db_name, entries, chunk_size=INSERT_CHUNK_SIZE,
+                      db_options=None):
+    """
+    Load entries into database in chunks, with "INSERT OR IGNORE"
+    semantics, so it is safe to re-run and new events could be added
+    to an existing database incrementally.
 
-    for idx, eventname in enumerate(events):
+    Returns the number of inserted and skipped events and solvers,
+    and of duplicate entries(see insert_entry_chunk).
+    """
+    engine, _ = create_db_connection(db_name, db_options=db_options)
+
+    nentries = 0
+    nduplicates = 0
+    eventnames = set()
+    with engine.begin() as conn:
+        nevents_before = count_rows(conn, Event.__table__)
+        nsolvers_before = count_rows(conn, Solver.__table__)
+
+        chunk = []
+        for entry in entries:
+            chunk.append(entry)
+            eventnames.add(entry["eventname"])
+            if len(chunk) >= chunk_size:
+                nduplicates += insert_entry_chunk(conn, chunk)
+                nentries += len(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            nduplicates += insert_entry_chunk(conn, chunk)
+            nentries += len(chunk)
+
+        nevents_inserted = count_rows(conn, Event.__table__) - nevents_before
+        nsolvers_inserted = \
+            count_rows(conn, Solver.__table__) - nsolvers_before
+
+    results = {
+        "events_inserted": nevents_inserted,
+        "events_skipped": len(eventnames) - nevents_inserted,
+        "solvers_inserted": nsolvers_inserted,
+        "solvers_skipped": nentries - nsolvers_inserted,
+        "duplicates": nduplicates}
+
+    print("=" * 20)
+    print("Events inserted and skipped(already exist): %d, %d"
+          % (results["events_inserted"], results["events_skipped"]))
+    print("Solvers inserted and skipped(already exist): %d, %d"
+          % (results["solvers_inserted"], results["solvers_skipped"]))
+    if nduplicates > 0:
+        print("Entries skipped as duplicates(cmtfile of another event): %d"
+              % nduplicates)
+    return results
+
+
+def iter_forward_entries(eventfile, cmtfolder, stationfolder, runbase,
+                         verbose=False):
+    for idx, eventname in enumerate(iter_txt_lines(eventfile)):
         cmtfile = os.path.join(cmtfolder, eventname)
 
         if is_source_inversion_eventname(eventname):
@@ -46,22 +137,36 @@ def fill_forward_db(config, verbose=False):
         entry_rundir = os.path.join(runbase, "archive", eventname)
 
         if verbose:
-            print("-" * 5 + " [%d/%d]%s " % (idx+1, nevents, eventname) +
-                  "-" * 5)
+            print("-" * 5 + " [%d]%s " % (idx+1, eventname) + "-" * 5)
             print("cmtfile: %s\nstationfile: %s\nentry_rundir: %s"
                   % (cmtfile, stationfile, entry_rundir))
 
-        eventobj = Event(eventname=eventname,
-                         cmtfile=cmtfile)
-        solver = Solver(stationfile=stationfile,
-                        runbase=entry_rundir,
-                        status=Status().new)
-        solver.event = eventobj
-        print(solver)
-        session.add(solver)
+        yield {"eventname": eventname, "cmtfile": cmtfile,
+               "stationfile": stationfile, "runbase": entry_rundir,
+               "tag": None}
 
-    session.commit()
-    session.close()
+
+def fill_forward_db(config, verbose=False):
+    db_name = config["runbase_info"]["db_name"]
+    runbase = config["runbase_info"]["runbase"]
+
+    cmtfolder = config["data_info"]["cmtfolder"]
+    stationfolder = config["data_info"]["stationfolder"]
+
+    print("Filling database: %s" % db_name)
+    print("=" * 20)
+    print("Runbase: %s" % runbase)
+    print("cmtfolder: %s" % cmtfolder)
+    print("stationfolder:%s" % stationfolder)
+
+    eventfile = config["data_info"]["total_eventfile"]
+    print("eventfile: %s" % eventfile)
+
+    entries = iter_forward_entries(eventfile, cmtfolder, stationfolder,
+                                   runbase, verbose=verbose)
+    return bulk_load_entries(
+        db_name, entries,
+        db_options=config["runbase_info"].get("db_options"))
 
 
 def fill_adjoint_db(config, verbose=False):
@@ -75,13 +180,29 @@ def fill_adjoint_db(config, verbose=False):
 def is_source_inversion_eventname(eventname):
     suffixes = ["_Mrr", "Mtt", "Mpp", "Mrt", "Mrp", "Mtp", "_dep",
                "_lon", "_lat"]
-    print("check eventname: ", eventname)
     for s in suffixes:
         if eventname.endswith(s):
             return True
     return False
 
 
+def iter_line_search_entries(eventfile, cmtfolder, stationfolder, runbase,
+                             perturbs, verbose=False):
+    tags = [get_model_perturbation_string(mp) for mp in perturbs]
+    for idx, eventname in enumerate(iter_txt_lines(eventfile)):
+        if verbose:
+            print("-" * 5 + " [%d]%s " % (idx+1, eventname) + "-" * 5)
+        cmtfile = os.path.join(cmtfolder, eventname)
+        stationfile = os.path.join(stationfolder, "STATIONS.%s" % eventname)
+
+        for tag in tags:
+            entry_rundir = os.path.join(
+                runbase, "archive", tag, eventname)
+            yield {"eventname": eventname, "cmtfile": cmtfile,
+                   "stationfile": stationfile, "runbase": entry_rundir,
+                   "tag": tag}
+
+
 def fill_line_search_db(config, verbose=False):
     """
     The line search is basically a bunch of forward simulations with
@@ -105,35 +226,16 @@ def fill_line_search_db(config, verbose=False):
     print("model perturbation: %s" % perturbs)
 
     eventfile = config["data_info"]["total_eventfile"]
-    events = read_txt_into_list(eventfile)
-    nevents = len(events)
     print("eventfile: %s" % eventfile)
-    print("Number of events: %s" % nevents)
-
-    engine = create_engine('sqlite:///%s' % db_name, echo=False)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    for idx, eventname in enumerate(events):
-        print("-" * 5 + " [%d/%d]%s " % (idx+1, nevents, eventname) + "-" * 5)
-        cmtfile = os.path.join(cmtfolder, eventname)
-        stationfile = os.path.join(stationfolder, "STATIONS.%s" % eventname)
-        eventobj = Event(eventname=eventname, cmtfile=cmtfile)
-
-        for mp in perturbs:
-            tag = get_model_perturbation_string(mp)
-            entry_rundir = os.path.join(
-                runbase, "archive", tag, eventname)
-            solver = Solver(stationfile=stationfile, runbase=entry_rundir,
-                            status=Status().new, tag=tag)
-            solver.event = eventobj
-            print(solver)
-            session.add(solver)
 
-    session.commit()
-    session.close()
+    entries = iter_line_search_entries(eventfile, cmtfolder, stationfolder,
+                                       runbase, perturbs, verbose=verbose)
+    return bulk_load_entries(
+        db_name, entries,
+        db_options=config["runbase_info"].get("db_options"))
 
 
+@with_metrics_summary
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', action='store', dest='config_file',
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""
+Database maintenance: schema upgrade, ANALYZE(refresh query planner
+statistics), VACUUM(reclaim free space) and WAL checkpoint. The schema
+of old databases is upgraded in place when connecting.
+"""
+from __future__ import print_function, division, absolute_import
+import argparse
+from seisforward.io import load_config
+from seisforward.forward_manager import create_db_connection
+from seisforward.db import optimize_db, get_schema_version
+from seisforward.metrics import with_metrics_summary
+
+
+@with_metrics_summary
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', action='store', dest='config_file',
+                        required=True, help="config yaml file")
+    parser.add_argument('--vacuum', action='store_true', dest='vacuum',
+                        help="rebuild the database file(needs exclusive "
+                        "access to the database)")
+    parser.add_argument('--no-analyze', action='store_false',
+                        dest='analyze', help="skip ANALYZE")
+    args = parser.parse_args()
+
+    config = load_config(args.config_file)
+    runbase_info = config["runbase_info"]
+    engine, _ = create_db_connection(runbase_info["db_name"],
+                                     runbase_info.get("db_options"))
+    with engine.connect() as conn:
+        print("Database schema version: %d" % get_schema_version(conn))
+    optimize_db(engine, analyze=args.analyze, vacuum=args.vacuum)
+
+
+if __name__ == "__main__":
+    main()
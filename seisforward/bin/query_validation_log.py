@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Filter the validation log(JSON lines) by status or runbase, without
+loading the whole file. Matched records are printed as JSON lines,
+or only counted for each status.
+"""
+from __future__ import print_function, division, absolute_import
+import json
+import argparse
+from collections import defaultdict
+
+from seisforward.io import load_config
+from seisforward.validation_log import get_validation_log_file, \
+    iter_validation_log, iter_latest_records
+from seisforward.metrics import with_metrics_summary
+
+
+@with_metrics_summary
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', action='store', dest='config_file',
+                        required=True, help="config yaml file")
+    parser.add_argument('-s', action='store', dest='status', nargs='+',
+                        default=None,
+                        help="only records with these status(after "
+                        "validation)")
+    parser.add_argument('-r', action='store', dest='runbase', default=None,
+                        help="only records with runbase matching this "
+                        "pattern, for example '*/archive/C2010*'")
+    parser.add_argument('--latest', action='store_true', dest='latest',
+                        help="only the latest record of each runbase")
+    parser.add_argument('--count', action='store_true', dest='count',
+                        help="only print the number of records in each "
+                        "status")
+    parser.add_argument('-f', action='store', dest='logfile', default=None,
+                        help="validation log file(default is the one in "
+                        "config)")
+    args = parser.parse_args()
+
+    config = load_config(args.config_file)
+    logfile = args.logfile
+    if logfile is None:
+        logfile = get_validation_log_file(config["runbase_info"])
+
+    if args.latest:
+        # the latest record has to be found before filtering by status
+        records = iter_latest_records(
+            iter_validation_log(logfile, runbase=args.runbase))
+        if args.status is not None:
+            records = (r for r in records if r["new_status"] in args.status)
+    else:
+        records = iter_validation_log(logfile, status=args.status,
+                                      runbase=args.runbase)
+
+    if args.count:
+        counts = defaultdict(lambda: 0)
+        for record in records:
+            counts[record["new_status"]] += 1
+        for status in sorted(counts):
+            print("%-24s %d" % (status, counts[status]))
+    else:
+        for record in records:
+            print(json.dumps(record, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
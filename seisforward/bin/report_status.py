@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Report throughput, queue latency and failure rates of simulations
+for each tag over time windows, from the status transition history
+in the database.
+"""
+from __future__ import print_function, division, absolute_import
+import argparse
+from datetime import datetime
+
+from seisforward.io import load_config, dump_json
+from seisforward.forward_manager import create_db_connection
+from seisforward.status_report import compute_status_report, \
+    print_status_report
+from seisforward.metrics import with_metrics_summary
+
+
+@with_metrics_summary
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', action='store', dest='config_file',
+                        required=True, help="config yaml file")
+    parser.add_argument('-w', action='store', dest='window', type=float,
+                        default=60, help="time window in minutes")
+    parser.add_argument('-t', action='store', dest='tag', default=None,
+                        help="only report solvers with this tag")
+    parser.add_argument('--since', action='store', dest='since',
+                        default=None,
+                        help="only use history since this UTC time, "
+                        "as 'YYYY-mm-ddTHH:MM'")
+    parser.add_argument('-o', action='store', dest='outputfn',
+                        default=None, help="output json file")
+    args = parser.parse_args()
+
+    config = load_config(args.config_file)
+    runbase_info = config["runbase_info"]
+    _, Session = create_db_connection(runbase_info["db_name"],
+                                      runbase_info.get("db_options"))
+
+    since = None
+    if args.since is not None:
+        since = datetime.strptime(args.since, "%Y-%m-%dT%H:%M")
+
+    session = Session()
+    report = compute_status_report(session, window_in_minutes=args.window,
+                                   since=since, tag=args.tag)
+    session.close()
+
+    print_status_report(report)
+    if args.outputfn is not None:
+        print("Output file: %s" % args.outputfn)
+        dump_json(report, args.outputfn)
+
+
+if __name__ == "__main__":
+    main()
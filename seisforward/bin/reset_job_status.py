@@ -2,21 +2,42 @@
 from __future__ import print_function, division, absolute_import
 import argparse
 from seisforward.io import load_config
+from seisforward.status import Status
 from seisforward.forward_manager import reset_forward_job
+from seisforward.metrics import with_metrics_summary
 
 
+@with_metrics_summary
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', action='store', dest='config_file',
                         required=True, help="config yaml file")
+    parser.add_argument('-s', action='store', dest='statuses', nargs='+',
+                        choices=Status().get_status(), default=None,
+                        help="status of entries to reset. Default: all "
+                        "but New, ReadytoLaunch, Done, Running and Queued")
+    parser.add_argument('-t', action='store', dest='tag', default=None,
+                        help="only reset entries with this tag")
+    parser.add_argument('--id-range', action='store', dest='id_range',
+                        nargs=2, type=int, default=None,
+                        metavar=('START', 'END'),
+                        help="only reset entries with id in [START, END]")
+    parser.add_argument('-j', action='store', dest='job_dir', default=None,
+                        help="only reset entries of events in this job "
+                        "folder")
+    parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                        help="only count the entries to be reset")
     args = parser.parse_args()
 
     config = load_config(args.config_file)
     simul_type = config["simulation"]["type"]
     db_name = config["runbase_info"]["db_name"]
+    db_options = config["runbase_info"].get("db_options")
 
-    if simul_type == "forward_simulation":
-        reset_forward_job(db_name)
+    if simul_type in ["forward_simulation", "line_search"]:
+        reset_forward_job(db_name, statuses=args.statuses, tag=args.tag,
+                          id_range=args.id_range, job_dir=args.job_dir,
+                          dry_run=args.dry_run, db_options=db_options)
     elif simul_type == "adjoint_simulation":
         pass
     elif simul_type == "source_inversion":
@@ -22,6 +22,7 @@ from seisforward.utils import safe_makedir
 from seisforward.io import load_config
 from seisforward.validate_config import validate_config
 from seisforward.easy_copy_specfem import easy_copy_specfem
+from seisforward.metrics import with_metrics_summary
 
 
 def create_runbase(runbase):
@@ -37,7 +38,11 @@ def setup_forward_runbase(config):
     specfemdir = config["data_info"]["specfemdir"]
     runbase = config["runbase_info"]["runbase"]
     targetdir = os.path.join(runbase, "specfem3d_globe")
-    easy_copy_specfem(specfemdir, targetdir)
+    runbase_info = config["runbase_info"]
+    easy_copy_specfem(
+        specfemdir, targetdir,
+        sync_workers=runbase_info.get("model_sync_workers", 1),
+        sync_checksum=runbase_info.get("model_sync_checksum", False))
 
 
 def setup_adjoint_runbase(config):
@@ -59,6 +64,7 @@ def setup_line_search_runbase(config):
     easy_copy_specfem(specfemdir, targetdir, model_flag=False)
 
 
+@with_metrics_summary
 def main():
 
     parser = argparse.ArgumentParser()
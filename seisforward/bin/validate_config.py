@@ -2,8 +2,10 @@ import os
 import argparse
 from seisforward.io import load_config
 from seisforward.validate_config import validate_config
+from seisforward.metrics import with_metrics_summary
 
 
+@with_metrics_summary
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', action='store', dest='config_file',
@@ -15,23 +15,74 @@ from __future__ import print_function, division, absolute_import
 import argparse
 from seisforward.io import load_config
 from seisforward.forward_validator import ForwardValidator
+from seisforward.metrics import with_metrics_summary
 
 
+@with_metrics_summary
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', action='store', dest='config_file',
                         required=True, help="config yaml file")
+    parser.add_argument('-m', action='store', dest='mode', type=int,
+                        default=1, choices=[1, 2, 3],
+                        help="validation mode: 1) check file existence; "
+                        "2) also check files with h5py(or h5dump) and "
+                        "bpls, and stations in synthetic.h5; "
+                        "3) also scan waveforms for NAN and zero traces")
+    parser.add_argument('--workers', action='store', dest='workers',
+                        type=int, default=1,
+                        help="number of workers to validate concurrently")
+    parser.add_argument('--executor', action='store', dest='executor',
+                        default="thread", choices=["thread", "process"],
+                        help="type of worker pool")
+    parser.add_argument('--force', action='store_true', dest='force',
+                        help="validate all runs, even if their files are "
+                        "unchanged since the last validation")
+    parser.add_argument('--deep-sample', action='store', dest='deep_sample',
+                        type=float, default=1.0,
+                        help="fraction of runs whose wavefield files are "
+                        "checked with bpls in mode 2 and 3")
+    parser.add_argument('--learn-reference', action='store', nargs='?',
+                        const="", default=None, dest='reference_run',
+                        help="learn the reference of forward wavefield "
+                        "files from this run(or the first 'Done' run) "
+                        "and exit")
+    parser.add_argument('--watch', action='store_true', dest='watch',
+                        help="keep running and validate runs as soon as "
+                        "they finish")
+    parser.add_argument('--interval', action='store', dest='interval',
+                        type=float, default=60,
+                        help="polling interval(in seconds) of watch mode")
+    parser.add_argument('--stale-minutes', action='store', type=float,
+                        dest='stale_minutes', default=None,
+                        help="in watch mode, also validate runs whose "
+                        "output_solver.txt is not modified for this long")
     args = parser.parse_args()
 
     config = load_config(args.config_file)
     simul_type = config["simulation"]["type"]
 
+    if args.reference_run is not None:
+        vd = ForwardValidator(config)
+        vd.learn_wavefield_reference(args.reference_run or None)
+        return
+
+    if args.watch and simul_type in ["forward_simulation", "line_search"]:
+        vd = ForwardValidator(config)
+        vd.watch(mode=args.mode, workers=args.workers,
+                 executor=args.executor, interval=args.interval,
+                 stale_time_in_minutes=args.stale_minutes,
+                 deep_sample=args.deep_sample)
+        return
+
     if simul_type == "forward_simulation":
         vd = ForwardValidator(config)
-        vd.run()
+        vd.run(mode=args.mode, workers=args.workers, executor=args.executor,
+               force=args.force, deep_sample=args.deep_sample)
     elif simul_type == "line_search":
         vd = ForwardValidator(config)
-        vd.run()
+        vd.run(mode=args.mode, workers=args.workers, executor=args.executor,
+               force=args.force, deep_sample=args.deep_sample)
     elif simul_type == "adjoint_simulation":
         pass
     else:
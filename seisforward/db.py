@@ -1,12 +1,39 @@
 from __future__ import print_function, division, absolute_import
+import os
+import sqlite3
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
 
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, \
+    Boolean, Index, inspect, text, create_engine, event
 from sqlalchemy.orm import relationship
+from sqlalchemy.pool import QueuePool, NullPool
 from sqlalchemy.ext.declarative import declarative_base
 
+from .status import Status
+
 
 Base = declarative_base()
 
+# default sqlite settings, could be overwritten by "db_options" in
+# config["runbase_info"]. WAL journal lets readers and one writer work
+# at the same time; busy_timeout(ms) is how long a connection waits
+# for a lock before raising "database is locked". Use journal_mode
+# "DELETE" if processes on different hosts share the database.
+DEFAULT_DB_OPTIONS = {
+    "journal_mode": "WAL",
+    "busy_timeout": 60000,
+    "synchronous": "NORMAL",
+    "cache_size": -65536,
+    "mmap_size": 268435456,
+    "pool_size": 5,
+}
+
+# engines are cached so connection pools are reused
+_engines = {}
+
 
 class SolverStatus(Base):
 
@@ -41,6 +68,10 @@ class Solver(Base):
     """
 
     __tablename__ = 'solver'
+    __table_args__ = (
+        Index("ix_solver_status_tag_id", "status", "tag", "id"),
+        Index("ix_solver_event_id", "event_id"),
+    )
 
     id = Column(Integer, primary_key=True)
     stationfile = Column(String)
@@ -50,6 +81,12 @@ class Solver(Base):
     # values so it helps to group jobs with the same perturbation
     # values)
     tag = Column(String)
+    # lease information, filled when the solver is claimed for job
+    # creation. lease_expires is cleared once the job folder is
+    # created; claims with expired leases could be re-claimed.
+    owner = Column(String)
+    claimed_at = Column(DateTime)
+    lease_expires = Column(DateTime)
 
     event_id = Column(Integer, ForeignKey('event.id'))
     event = relationship("Event", back_populates="solver")
@@ -67,6 +104,10 @@ class AdjointSolver(Base):
     """
 
     __tablename__ = 'adjointsolver'
+    __table_args__ = (
+        Index("ix_adjointsolver_status_id", "status", "id"),
+        Index("ix_adjointsolver_event_id", "event_id"),
+    )
 
     id = Column(Integer, primary_key=True)
     stationfile = Column(String)
@@ -81,3 +122,311 @@ class AdjointSolver(Base):
         return "<AdjointSolver(eventid=%d, stationfile='%s', " \
             "adjointfile='%s', status=%s)>" \
             % (self.event_id, self.stationfile, self.adjointfile, self.status)
+
+
+class SolverStatusCount(Base):
+    """
+    Cached number of solvers for each (status, tag). It is kept up to
+    date by triggers on the solver table(see create_status_counter).
+    Solvers without tag are counted under tag ''.
+    """
+
+    __tablename__ = 'solver_status_count'
+
+    status = Column(String, primary_key=True)
+    tag = Column(String, primary_key=True, default='')
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return "<SolverStatusCount(status='%s', tag='%s', count=%d)>" % (
+            self.status, self.tag, self.count)
+
+
+class StatusTransition(Base):
+    """
+    Append-only history of solver status changes
+    """
+
+    __tablename__ = 'status_transition'
+    __table_args__ = (
+        Index("ix_status_transition_solver_id", "solver_id"),
+        Index("ix_status_transition_timestamp", "timestamp"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    solver_id = Column(Integer, ForeignKey('solver.id'))
+    old_status = Column(String)
+    new_status = Column(String)
+    timestamp = Column(DateTime)
+    # who made the change, as "ClassName@hostname:pid"
+    actor = Column(String)
+
+    def __repr__(self):
+        return "<StatusTransition(solver_id=%d, '%s' --> '%s', " \
+            "timestamp=%s, actor='%s')>" % (
+                self.solver_id, self.old_status, self.new_status,
+                self.timestamp, self.actor)
+
+
+class ValidationCache(Base):
+    """
+    Last validation verdict of each run directory, together with the
+    fingerprint(size and mtime) of the files validated. Runs whose
+    fingerprint is unchanged do not need to be validated again.
+    """
+
+    __tablename__ = 'validation_cache'
+
+    runbase = Column(String, primary_key=True)
+    fingerprint = Column(String)
+    mode = Column(Integer)
+    # False if the deep check(bpls of wavefields) was skipped
+    deep_check = Column(Boolean)
+    status = Column(String)
+    msg = Column(String)
+    checked_at = Column(DateTime)
+
+    def __repr__(self):
+        return "<ValidationCache(runbase='%s', status='%s', mode=%s)>" % (
+            self.runbase, self.status, self.mode)
+
+
+_INCR_STATUS_COUNT = """
+    INSERT OR IGNORE INTO solver_status_count (status, tag, count)
+        VALUES (NEW.status, COALESCE(NEW.tag, ''), 0);
+    UPDATE solver_status_count SET count = count + 1
+        WHERE status = NEW.status AND tag = COALESCE(NEW.tag, '');"""
+
+_DECR_STATUS_COUNT = """
+    UPDATE solver_status_count SET count = count - 1
+        WHERE status = OLD.status AND tag = COALESCE(OLD.tag, '');"""
+
+STATUS_COUNT_TRIGGERS = {
+    "solver_status_count_insert":
+        "CREATE TRIGGER IF NOT EXISTS solver_status_count_insert "
+        "AFTER INSERT ON solver BEGIN %s\nEND" % _INCR_STATUS_COUNT,
+    "solver_status_count_delete":
+        "CREATE TRIGGER IF NOT EXISTS solver_status_count_delete "
+        "AFTER DELETE ON solver BEGIN %s\nEND" % _DECR_STATUS_COUNT,
+    "solver_status_count_update":
+        "CREATE TRIGGER IF NOT EXISTS solver_status_count_update "
+        "AFTER UPDATE OF status, tag ON solver "
+        "WHEN OLD.status IS NOT NEW.status OR OLD.tag IS NOT NEW.tag "
+        "BEGIN %s%s\nEND" % (_DECR_STATUS_COUNT, _INCR_STATUS_COUNT),
+}
+
+
+def _get_schema_names(conn):
+    result = conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"))
+    return set(row[0] for row in result)
+
+
+def add_missing_columns(conn):
+    """
+    Add columns defined in the tables but missing in the database(
+    created by an older version of the code), using
+    "ALTER TABLE ... ADD COLUMN". New columns are filled with NULL.
+    """
+    inspector = inspect(conn)
+    existing_tables = inspector.get_table_names()
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = [c["name"] for c in inspector.get_columns(table.name)]
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            coltype = column.type.compile(dialect=conn.dialect)
+            conn.execute(text("ALTER TABLE %s ADD COLUMN %s %s"
+                              % (table.name, column.name, coltype)))
+
+
+def create_status_counter(conn):
+    """
+    Create(if not exists) the solver_status_count table and the
+    triggers that keep it in sync with the solver table. If the
+    table is newly created, it is filled from the solver table.
+    """
+    existing = _get_schema_names(conn)
+    if SolverStatusCount.__tablename__ not in existing:
+        SolverStatusCount.__table__.create(bind=conn)
+        conn.execute(text(
+            "INSERT INTO solver_status_count (status, tag, count) "
+            "SELECT status, COALESCE(tag, ''), COUNT(*) FROM solver "
+            "GROUP BY status, COALESCE(tag, '')"))
+    for name, sql in sorted(STATUS_COUNT_TRIGGERS.items()):
+        if name not in existing:
+            conn.execute(text(sql))
+
+
+def create_missing_tables(conn):
+    """ Create tables(with their indexes) missing in database """
+    Base.metadata.create_all(bind=conn, checkfirst=True)
+
+
+def create_missing_indexes(conn):
+    """ Create indexes defined in the tables but missing in database """
+    existing_tables = inspect(conn).get_table_names()
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def add_missing_statuses(conn):
+    """ Insert statuses defined in Status but missing in database """
+    conn.execute(SolverStatus.__table__.insert().prefix_with("OR IGNORE"),
+                 [{"name": s} for s in Status().get_status()])
+
+
+# schema migrations, as (version, description, function). The schema
+# version of a database is stored in "PRAGMA user_version" and all
+# migrations with a larger version are applied in order by upgrade_db.
+# Migrations should be safe to run on a database which already has
+# the changes(for example, one created by create_all).
+MIGRATIONS = [
+    (1, "add solver claim/lease columns", add_missing_columns),
+    (2, "add solver status counter table and triggers",
+     create_status_counter),
+    (3, "add indexes on status, tag and event_id", create_missing_indexes),
+    (4, "add status transition history table", create_missing_tables),
+    (5, "add validation fingerprint cache table", create_missing_tables),
+    (6, "add missing statuses(IncompleteOutput)", add_missing_statuses),
+    (7, "add validation cache deep_check column", add_missing_columns),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def upgrade_db(engine):
+    """
+    Upgrade the database schema in place to SCHEMA_VERSION. Returns
+    the list of versions applied.
+    """
+    with engine.connect() as conn:
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return []
+
+    applied = []
+    with engine.begin() as conn:
+        # lock the database so migrations are applied only once
+        conn.execute(text("BEGIN IMMEDIATE"))
+        version = get_schema_version(conn)
+        for _version, description, migration in MIGRATIONS:
+            if _version <= version:
+                continue
+            print("Upgrade database schema to version %d: %s"
+                  % (_version, description))
+            migration(conn)
+            conn.execute(text("PRAGMA user_version = %d" % _version))
+            applied.append(_version)
+    return applied
+
+
+def get_db_options(db_options=None):
+    """ Merge user db_options into the default ones """
+    options = dict(DEFAULT_DB_OPTIONS)
+    if db_options:
+        for key in db_options:
+            if key not in DEFAULT_DB_OPTIONS:
+                raise ValueError("Unknown db option(%s), should be in %s"
+                                 % (key, sorted(DEFAULT_DB_OPTIONS)))
+        options.update(db_options)
+    return options
+
+
+def create_db_engine(db_name, db_options=None, echo=False):
+    """
+    Create(or reuse) the sqlalchemy engine of the sqlite database.
+    All connections of the engine are set up with pragmas from
+    db_options(see DEFAULT_DB_OPTIONS).
+    """
+    options = get_db_options(db_options)
+    key = (os.path.abspath(db_name), tuple(sorted(options.items())), echo)
+    if key in _engines:
+        return _engines[key]
+
+    engine = create_engine(
+        'sqlite:///%s' % db_name, echo=echo, poolclass=QueuePool,
+        pool_size=options["pool_size"], max_overflow=options["pool_size"],
+        connect_args={"timeout": options["busy_timeout"] / 1000.0,
+                      "check_same_thread": False})
+
+    pragmas = [("journal_mode", options["journal_mode"]),
+               ("busy_timeout", options["busy_timeout"]),
+               ("synchronous", options["synchronous"]),
+               ("cache_size", options["cache_size"]),
+               ("mmap_size", options["mmap_size"])]
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute("PRAGMA %s = %s" % (name, value))
+        cursor.close()
+
+    _engines[key] = engine
+    return engine
+
+
+def create_readonly_db_engine(db_name, echo=False):
+    """
+    Create a sqlalchemy engine which opens the sqlite database read
+    only(as an URI with mode=ro). No pragma is set and the engine is
+    not cached, so nothing is written to the database.
+    """
+    uri = "file:%s?mode=ro" % quote(os.path.abspath(db_name))
+
+    def _connect():
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    return create_engine("sqlite://", creator=_connect, echo=echo,
+                         poolclass=NullPool)
+
+
+def check_schema_version(engine):
+    """
+    Raise ValueError if the schema of the database is older than
+    SCHEMA_VERSION(for a database which is not upgraded in place)
+    """
+    with engine.connect() as conn:
+        version = get_schema_version(conn)
+    if version < SCHEMA_VERSION:
+        raise ValueError(
+            "Database schema(version %d) is older than version %d. "
+            "Upgrade it first with maintain_database" % (
+                version, SCHEMA_VERSION))
+
+
+def optimize_db(engine, analyze=True, vacuum=False, checkpoint=True):
+    """
+    Database maintenance:
+    1) analyze: update the statistics used by the query planner;
+    2) vacuum: rebuild the database file to reclaim free space;
+    3) checkpoint: move the content of WAL file back to the database
+       and truncate the WAL file.
+    """
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        if analyze:
+            print("ANALYZE...")
+            cursor.execute("ANALYZE")
+            conn.commit()
+        if vacuum:
+            # VACUUM can not run inside a transaction
+            print("VACUUM...")
+            conn.commit()
+            cursor.execute("VACUUM")
+        if checkpoint:
+            print("WAL checkpoint...")
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        cursor.close()
+    finally:
+        conn.close()
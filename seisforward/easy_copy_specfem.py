@@ -7,12 +7,19 @@
 from __future__ import print_function, division, absolute_import
 import os
 import glob
-import shutil
 from .utils import copyfile, safe_makedir
 from .check_specfem import check_specfem
+from .metrics import timed
+from .file_sync import sync_files, print_sync_stats
 
 
-def safe_copy_model_file(specfemdir, targetdir):
+def safe_copy_model_file(specfemdir, targetdir, store=None, workers=1,
+                         checksum=False):
+    """
+    Sync model files into targetdir: files already there(same size and
+    mtime, or same checksum if checksum is True) are not copied again,
+    and large files are copied in parallel chunks by workers threads.
+    """
     origindir = os.path.join(specfemdir, "DATABASES_MPI")
     model_files = glob.glob(os.path.join(origindir, "*"))
 
@@ -24,12 +31,27 @@ def safe_copy_model_file(specfemdir, targetdir):
         os.makedirs(target_model_dir)
 
     print("-"*10 + "\nCopy model files:")
-    for _file in model_files:
-        print("[%s --> %s]" % (_file, target_model_dir))
-        shutil.copy2(_file, target_model_dir)
+    if store is not None:
+        for _file in model_files:
+            print("[%s --> %s]" % (_file, target_model_dir))
+            store.place(_file, os.path.join(target_model_dir,
+                                            os.path.basename(_file)))
+        return
 
+    pairs = [(_file, os.path.join(target_model_dir, os.path.basename(_file)))
+             for _file in model_files]
+    stats = sync_files(pairs, workers=workers, checksum=checksum)
+    print_sync_stats(stats)
 
-def easy_copy_specfem(specfemdir, targetdir, model_flag=True):
+
+@timed("file.copy_specfem")
+def easy_copy_specfem(specfemdir, targetdir, model_flag=True, store=None,
+                      sync_workers=1, sync_checksum=False):
+    """
+    If store(ArtifactStore) is given, files are linked from the store
+    instead of copied, except DATA/Par_file which is modified later.
+    Otherwise model files are synced(see safe_copy_model_file).
+    """
 
     print("*" * 10 + " Copy Specfem " + "*" * 10)
     print("Specfem dir: %s" % specfemdir)
@@ -52,7 +74,11 @@ def easy_copy_specfem(specfemdir, targetdir, model_flag=True):
     for fn in filelist:
         origin_file = os.path.join(specfemdir, fn)
         target_file = os.path.join(targetdir, fn)
-        copyfile(origin_file, target_file)
+        if store is None or fn == "DATA/Par_file":
+            copyfile(origin_file, target_file)
+        else:
+            store.place(origin_file, target_file)
 
     if model_flag:
-        safe_copy_model_file(specfemdir, targetdir)
+        safe_copy_model_file(specfemdir, targetdir, store=store,
+                             workers=sync_workers, checksum=sync_checksum)
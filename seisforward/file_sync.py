@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Incremental sync of large files(for example, model files in
+DATABASES_MPI): files already at the target with the same size and
+mtime(or checksum, if asked) are skipped, and the others are copied
+in parallel chunks in kernel space(os.copy_file_range or os.sendfile,
+if available).
+"""
+from __future__ import print_function, division, absolute_import
+import os
+import time
+import shutil
+import tempfile
+
+from . import metrics
+from .utils import parallel_map
+from .artifact_store import hash_file
+
+
+# size of each chunk copied by a worker
+SYNC_CHUNK_SIZE = 64 * 1024 * 1024
+
+# mtime of target files(preserved by the copy) could be rounded by the
+# filesystem
+MTIME_TOLERANCE = 1.0
+
+
+def file_is_synced(src, dst, checksum=False):
+    """
+    True if dst exists and has the same size as src, and the same
+    mtime(or the same sha1, if checksum is True)
+    """
+    if not os.path.isfile(dst):
+        return False
+    src_stat = os.stat(src)
+    dst_stat = os.stat(dst)
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if checksum:
+        with metrics.timer("sync.checksum"):
+            return hash_file(src) == hash_file(dst)
+    return abs(src_stat.st_mtime - dst_stat.st_mtime) <= MTIME_TOLERANCE
+
+
+def _copy_range(fd_in, fd_out, offset, count):
+    """ Copy count bytes at offset, between two file descriptors """
+    end = offset + count
+    while offset < end:
+        if hasattr(os, "copy_file_range"):
+            try:
+                n = os.copy_file_range(fd_in, fd_out, end - offset,
+                                       offset, offset)
+            except OSError:
+                # not supported by the filesystem(or across devices
+                # for old kernels), use the next method
+                n = None
+            if n is not None:
+                if n == 0:
+                    raise ValueError("Source file truncated during copy")
+                offset += n
+                continue
+        if hasattr(os, "sendfile"):
+            os.lseek(fd_out, offset, os.SEEK_SET)
+            try:
+                n = os.sendfile(fd_out, fd_in, offset, end - offset)
+            except OSError:
+                n = None
+            if n is not None:
+                if n == 0:
+                    raise ValueError("Source file truncated during copy")
+                offset += n
+                continue
+        buf = os.pread(fd_in, min(end - offset, 1024 * 1024), offset)
+        if len(buf) == 0:
+            raise ValueError("Source file truncated during copy")
+        os.pwrite(fd_out, buf, offset)
+        offset += len(buf)
+
+
+def _copy_chunk(args):
+    src, dst, offset, count = args
+    fd_in = os.open(src, os.O_RDONLY)
+    try:
+        fd_out = os.open(dst, os.O_WRONLY)
+        try:
+            _copy_range(fd_in, fd_out, offset, count)
+        finally:
+            os.close(fd_out)
+    finally:
+        os.close(fd_in)
+    return count
+
+
+def copy_file_chunked(src, dst, chunk_size=SYNC_CHUNK_SIZE, workers=1):
+    """
+    Copy src to dst(with mode and mtime, as shutil.copy2), in chunks
+    of chunk_size copied by workers threads. The file is written to a
+    temporary file and renamed, so dst is never left half written.
+    Returns the number of bytes copied.
+    """
+    size = os.stat(src).st_size
+    dirname = os.path.dirname(os.path.abspath(dst))
+    fd, tmpfile = tempfile.mkstemp(dir=dirname, prefix=".sync-")
+    try:
+        os.ftruncate(fd, size)
+        os.close(fd)
+        chunks = [(src, tmpfile, offset, min(chunk_size, size - offset))
+                  for offset in range(0, size, chunk_size)]
+        for _ in parallel_map(_copy_chunk, chunks, workers=workers):
+            pass
+        shutil.copystat(src, tmpfile)
+        # replace instead of writing into dst, which could be a link
+        os.rename(tmpfile, dst)
+    except Exception:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+    return size
+
+
+def sync_files(pairs, workers=1, checksum=False,
+               chunk_size=SYNC_CHUNK_SIZE):
+    """
+    Sync each (src, dst) in pairs: skip dst if already synced,
+    otherwise copy it in chunks with workers threads. Returns
+    statistics: number of files copied and skipped, bytes copied and
+    the throughput(bytes per second).
+    """
+    stats = {"copied": 0, "skipped": 0, "bytes": 0, "seconds": 0.0,
+             "throughput": None}
+    t0 = time.time()
+    for src, dst in pairs:
+        if file_is_synced(src, dst, checksum=checksum):
+            print("[%s] already synced" % dst)
+            stats["skipped"] += 1
+            continue
+        print("[%s --> %s]" % (src, dst))
+        with metrics.timer("file.copy"):
+            stats["bytes"] += copy_file_chunked(
+                src, dst, chunk_size=chunk_size, workers=workers)
+        stats["copied"] += 1
+
+    stats["seconds"] = time.time() - t0
+    if stats["seconds"] > 0:
+        stats["throughput"] = stats["bytes"] / stats["seconds"]
+    metrics.count("sync.files_copied", stats["copied"])
+    metrics.count("sync.files_skipped", stats["skipped"])
+    metrics.count("sync.bytes", stats["bytes"])
+    return stats
+
+
+def print_sync_stats(stats):
+    throughput = stats["throughput"] or 0.0
+    print("Synced files: %d copied, %d skipped; %.1f MB moved in %.2f sec "
+          "(%.1f MB/s)" % (stats["copied"], stats["skipped"],
+                           stats["bytes"] / 1024.0**2, stats["seconds"],
+                           throughput / 1024.0**2))
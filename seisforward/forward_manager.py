@@ -1,60 +1,113 @@
 #!/usr/bin/env python
 from __future__ import print_function, division, absolute_import
 import os
+import re
+import errno
 import shutil
+import socket
 from copy import deepcopy
+from collections import defaultdict
+from datetime import datetime, timedelta
 
-from sqlalchemy import create_engine
+from sqlalchemy import text, or_, and_, func, literal, DateTime
 from sqlalchemy.orm import sessionmaker
 
 from . import statusobj
+from . import metrics
 from .utils import safe_makedir, get_package_path, \
-    check_folders_exist, clean_specfem, make_title
-from .io import load_config, dump_list_to_txt, dump_yaml
+    check_folders_exist, clean_specfem, make_title, split_into_chunks, \
+    parallel_map
+from .io import load_config, dump_list_to_txt, dump_yaml, \
+    read_txt_into_list
 from .validate_config import validate_config
-from .db import Solver, Event
+from .db import Solver, Event, SolverStatusCount, StatusTransition, \
+    ValidationCache, create_db_engine, create_readonly_db_engine, \
+    check_schema_version, upgrade_db
 from .generate_batch_script import generate_pbs_script, generate_lsf_script
 from .specfem_parfile_util import modify_specfem_parfile
 from .check_specfem import check_specfem
 from .easy_copy_specfem import easy_copy_specfem
+from .artifact_store import get_artifact_store, place_file
+from .job_planner import make_forward_plan
+from .job_journal import JobJournal, get_job_journal_file, \
+    load_job_states, get_unfinished_jobs
 
 
-def setup_entry_dir(entries, specfemdir):
+# max number of bound parameters in one "IN (...)" list. SQLite
+# limits the number of host parameters per statement(999 for old
+# versions), so large id lists are split into chunks of this size.
+DB_CHUNK_SIZE = 500
+
+# default lease time(in minutes) of claimed solvers. If the job
+# folder is not created within this time(for example, the job
+# creation crashed), the solvers could be claimed again.
+DEFAULT_LEASE_TIME_IN_MINUTES = 120
+
+# columns of the lightweight rows returned by iter_with_status
+SOLVER_ROW_COLUMNS = (Solver.id, Solver.runbase, Solver.stationfile,
+                      Solver.status, Solver.tag, Solver.claimed_at,
+                      Event.eventname, Event.cmtfile)
+
+# status of solvers which are not reset by default, since they are
+# finished or still alive on the cluster
+RESET_EXCLUDED_STATUS = [statusobj.done, statusobj.running, statusobj.queued]
+
+
+def setup_entry_dir(entries, specfemdir, workers=1, store=None,
+                    callback=None):
     """
     Setup the directory for each entry for forward simulation
     1) create directory(DATA, OUTPUT_FILES, DATABASES_MPI)
     2) copy CMTSOLUTION and STATION(forward simulation)
     3) copy values_from_mesher.h and addressing.h
+    Entries are set up by a pool of workers(threads) if workers > 1.
+    Files of 3) are linked from store(ArtifactStore) if given. If
+    callback is given, it is called with the index of each entry set
+    up, in order.
     """
+    def _setup(entry):
+        setup_one_entry_dir(entry[0], entry[1], specfemdir, store=store)
+        return entry
+
     nentries = len(entries)
-    for idx, (solver, event) in enumerate(entries):
-        runbase = solver.runbase
+    for idx, (solver, event) in enumerate(
+            parallel_map(_setup, entries, workers=workers)):
         print("[%d/%d] %s --- runbase: %s" % (idx+1, nentries,
-                                              event.eventname, runbase))
-        safe_makedir(runbase)
+                                              event.eventname,
+                                              solver.runbase))
+        if callback is not None:
+            callback(idx)
 
-        # copy CMTSOLUTION and STATIONS
-        targetdir = os.path.join(runbase, "DATA")
-        safe_makedir(targetdir)
-        cmtfile = event.cmtfile
+
+def setup_one_entry_dir(solver, event, specfemdir, store=None):
+    """ Setup the directory of one entry, see setup_entry_dir """
+    runbase = solver.runbase
+    safe_makedir(runbase)
+
+    # copy CMTSOLUTION and STATIONS
+    targetdir = os.path.join(runbase, "DATA")
+    safe_makedir(targetdir)
+    cmtfile = event.cmtfile
+    stationfile = solver.stationfile
+    with metrics.timer("file.copy"):
         shutil.copy(cmtfile, os.path.join(targetdir, "CMTSOLUTION"))
-        stationfile = solver.stationfile
         shutil.copy(stationfile, os.path.join(targetdir, "STATIONS"))
+    metrics.count("file.copy.files", 2)
 
-        # copy values_from_mesher.h and addressing.h
-        targetdir = os.path.join(runbase, "OUTPUT_FILES")
-        safe_makedir(targetdir)
-        filelist = ["values_from_mesher.h", "addressing.txt"]
-        for _file in filelist:
-            file1 = os.path.join(specfemdir, "OUTPUT_FILES", _file)
-            file2 = os.path.join(targetdir, _file)
-            shutil.copy(file1, file2)
+    # copy values_from_mesher.h and addressing.h
+    targetdir = os.path.join(runbase, "OUTPUT_FILES")
+    safe_makedir(targetdir)
+    filelist = ["values_from_mesher.h", "addressing.txt"]
+    for _file in filelist:
+        file1 = os.path.join(specfemdir, "OUTPUT_FILES", _file)
+        file2 = os.path.join(targetdir, _file)
+        place_file(store, file1, file2)
 
-        # mkdir DATABASES_MPI, but no files copied at this stage(
-        # using symbolic links for model files instead at simulation
-        # stage)
-        targetdir = os.path.join(runbase, "DATABASES_MPI")
-        safe_makedir(targetdir)
+    # mkdir DATABASES_MPI, but no files copied at this stage(
+    # using symbolic links for model files instead at simulation
+    # stage)
+    targetdir = os.path.join(runbase, "DATABASES_MPI")
+    safe_makedir(targetdir)
 
 
 def validate_entries(entries):
@@ -97,12 +150,13 @@ def dump_eventlist(entries, job_dir, n_serial, n_simul):
         dump_list_to_txt(events[start_idx:end_idx], fn)
 
 
-def create_job_folder(job_dir, entries, config, specfem_base):
+def create_job_folder(job_dir, entries, config, specfem_base, store=None):
     """
     create job folder, to hold XEVENTID.* and pbs script.
     Keep an copy of specfem stuff(excluding the model file because of
     its size) at local dir. So jobs could be submitted inside the job
-    dir indepandently.
+    dir indepandently. If store(ArtifactStore) is given, the specfem
+    files are linked from the store, except Par_file.
     """
     print("*"*20 + "\nCreat job sub folders")
     if not os.path.exists(job_dir):
@@ -122,7 +176,10 @@ def create_job_folder(job_dir, entries, config, specfem_base):
     safe_makedir(local_specfem)
 
     copy_model_flag = config["runbase_info"]["copy_model_to_sub_job_folder"]
-    easy_copy_specfem(specfem_base, local_specfem, model_flag=copy_model_flag)
+    easy_copy_specfem(
+        specfem_base, local_specfem, model_flag=copy_model_flag, store=store,
+        sync_workers=config["runbase_info"].get("model_sync_workers", 1),
+        sync_checksum=config["runbase_info"].get("model_sync_checksum", False))
     clean_specfem(local_specfem)
 
     # copy scripts template
@@ -146,24 +203,75 @@ def create_job_folder(job_dir, entries, config, specfem_base):
     modify_specfem_parfile(config, local_specfem)
 
 
-def create_db_connection(db_name):
+def create_db_connection(db_name, db_options=None, readonly=False):
+    """
+    Connect to the database and upgrade its schema. If readonly, the
+    database is opened read only and never upgraded(or tuned by
+    pragmas), so ValueError is raised if its schema is outdated.
+    """
     if not os.path.exists(db_name):
         raise ValueError("No db exists: %s" % db_name)
 
-    engine = create_engine('sqlite:///%s' % db_name, echo=False)
+    if readonly:
+        engine = create_readonly_db_engine(db_name)
+        check_schema_version(engine)
+    else:
+        engine = create_db_engine(db_name, db_options=db_options)
+        upgrade_db(engine)
     Session = sessionmaker(bind=engine)
     return engine, Session
 
 
+def filter_status(query, status):
+    """ Filter query by one status or a list of status """
+    if isinstance(status, (list, tuple, set)):
+        return query.filter(Solver.status.in_(list(status)))
+    return query.filter(Solver.status == status)
+
+
+def update_status(query, values, actor, timestamp=None):
+    """
+    Update solvers selected by query(on Solver only) with values. If
+    values contains "status", the status transitions are appended to
+    the status_transition table, in the same transaction and also by
+    a set-based "INSERT ... SELECT" statement.
+
+    Returns the number of rows updated.
+    """
+    if "status" in values:
+        if timestamp is None:
+            timestamp = datetime.utcnow()
+        status = values["status"]
+        changed = query.filter(Solver.status.is_distinct_from(status)).\
+            with_entities(Solver.id, Solver.status, literal(status),
+                          literal(timestamp, DateTime), literal(actor))
+        insert = StatusTransition.__table__.insert().from_select(
+            ["solver_id", "old_status", "new_status", "timestamp", "actor"],
+            changed.statement)
+        query.session.execute(insert)
+    return query.update(values, synchronize_session=False)
+
+
+def get_default_owner():
+    """ Owner name of claims, as "hostname:pid" """
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+
 class ForwardManager(object):
     """
     Forward simulation manager(mainly DB utilities)
     """
-    def __init__(self, config):
+    def __init__(self, config, readonly=False):
         self._load_config(config)
 
-        self.engine, self.Session = \
-            create_db_connection(self.config["runbase_info"]["db_name"])
+        runbase_info = self.config["runbase_info"]
+        self.engine, self.Session = create_db_connection(
+            runbase_info["db_name"], runbase_info.get("db_options"),
+            readonly=readonly)
+        self.owner = get_default_owner()
+        self.actor = "%s@%s" % (type(self).__name__, self.owner)
+        self.lease_time = timedelta(minutes=self.config["runbase_info"].get(
+            "lease_time_in_minutes", DEFAULT_LEASE_TIME_IN_MINUTES))
 
     def _load_config(self, config):
         if isinstance(config, str):
@@ -177,11 +285,12 @@ class ForwardManager(object):
 
     def fetch_with_status(self, status, tag=None, num_to_fetch=None):
         """
-        Fetch Solver and Event together from database
+        Fetch Solver and Event together from database. status could be
+        one status or a list of status.
         """
         session = self.Session()
-        query = session.query(Solver, Event).join(Event).\
-            filter(Solver.status == status)
+        query = filter_status(session.query(Solver, Event).join(Event),
+                              status)
 
         if tag is not None:
             query = query.filter(Solver.tag == tag)
@@ -190,35 +299,481 @@ class ForwardManager(object):
         if num_to_fetch is not None and num_to_fetch > 0:
             query = query.limit(num_to_fetch)
 
-        entries = query.all()
+        with metrics.timer("db.fetch"):
+            entries = query.all()
         session.close()
         return entries
 
+    def iter_with_status(self, status, tag=None, batch_size=1000):
+        """
+        Iterate over solvers with status(one status or a list of
+        status), ordered by id. Instead of ORM objects, it yields
+        lightweight rows with only columns in SOLVER_ROW_COLUMNS(id,
+        runbase, stationfile, status, tag, claimed_at, eventname,
+        cmtfile).
+
+        Rows are fetched in pages of batch_size(keyset pagination on
+        Solver.id), each page in its own short session, so memory
+        usage is constant and the database is not held open between
+        pages(status could be updated while iterating).
+        """
+        last_id = None
+        while True:
+            session = self.Session()
+            try:
+                query = filter_status(
+                    session.query(*SOLVER_ROW_COLUMNS).join(Event), status)
+                if tag is not None:
+                    query = query.filter(Solver.tag == tag)
+                if last_id is not None:
+                    query = query.filter(Solver.id > last_id)
+                with metrics.timer("db.fetch"):
+                    rows = query.order_by(Solver.id).limit(batch_size).all()
+            finally:
+                session.close()
+
+            for row in rows:
+                yield row
+
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1].id
+
     def update_with_status(self, entries, status=None):
         """
         Update Solver in entries to status(if given) or from Solver.status
+
+        Returns the number of rows whose status was changed.
+        """
+        if status is None:
+            id_status = [(solver.id, solver.status) for solver, _ in entries]
+        else:
+            id_status = [(solver.id, status) for solver, _ in entries]
+        return self.bulk_update_status(id_status)
+
+    @metrics.timed("db.update")
+    def bulk_update_status(self, id_status, chunk_size=DB_CHUNK_SIZE):
+        """
+        Update the status of solvers given by a list of (solver_id, status)
+        pairs. Ids are grouped by target status and each group is written
+        with set-based "UPDATE ... WHERE id IN (...)" statements(chunked
+        by chunk_size), all inside one transaction. Status transitions
+        are recorded in the status_transition table.
+
+        Rows already in the target status are not touched. Returns the
+        number of rows whose status was changed.
+        """
+        groups = defaultdict(list)
+        for solver_id, status in id_status:
+            groups[status].append(solver_id)
+
+        nchanged = 0
+        now = datetime.utcnow()
+        session = self.Session()
+        try:
+            for status in sorted(groups):
+                for ids in split_into_chunks(groups[status], chunk_size):
+                    query = session.query(Solver).\
+                        filter(Solver.id.in_(ids)).\
+                        filter(Solver.status.is_distinct_from(status))
+                    nchanged += update_status(
+                        query, {'status': status}, self.actor, now)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        return nchanged
+
+    @metrics.timed("db.claim")
+    def claim_batch(self, n, tag=None, allow_partial=True, batch_size=None):
         """
+        Atomically claim(at most) n solvers, which are either "New" or
+        "ReadytoLaunch" with an expired lease. Selecting and marking
+        the rows happens in one "BEGIN IMMEDIATE" transaction, so
+        concurrent claimers never get the same solvers.
+
+        Claimed solvers are set to "ReadytoLaunch" with the owner,
+        claim time and lease expiration recorded. If n is None, all
+        available solvers are claimed. If allow_partial is False and
+        less than n solvers are available, nothing is claimed and an
+        empty list is returned. If batch_size is given, the number of
+        claimed solvers is rounded down to a multiple of batch_size.
+
+        Returns a list of (Solver, Event), same as fetch_with_status.
+        """
+        now = datetime.utcnow()
+        lease_expires = now + self.lease_time
+
         session = self.Session()
+        try:
+            # take the database write lock before reading, so no other
+            # process could claim in between
+            session.execute(text("BEGIN IMMEDIATE"))
+            entries = self._query_claimable(
+                session, now, n, tag=tag, batch_size=batch_size)
+
+            if len(entries) == 0 or \
+                    (not allow_partial and len(entries) < n):
+                session.rollback()
+                return []
+
+            values = self._claim(session, entries, now, lease_expires)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
         for solver, _ in entries:
-            if status is None:
-                session.query(Solver).filter(Solver.id == solver.id).\
-                    update({'status': solver.status})
-            else:
-                session.query(Solver).filter(Solver.id == solver.id).\
-                    update({'status': status})
+            for key, value in values.items():
+                setattr(solver, key, value)
+        return entries
 
-        session.commit()
-        session.close()
+    @metrics.timed("db.claim")
+    def claim_ids(self, ids):
+        """
+        Atomically claim the solvers with ids(same as claim_batch). If
+        any of them is not claimable any more(claimed or changed by
+        others since the ids were selected), nothing is claimed and
+        ValueError is raised.
+
+        Returns a list of (Solver, Event), in the order of ids.
+        """
+        now = datetime.utcnow()
+        lease_expires = now + self.lease_time
+
+        session = self.Session()
+        try:
+            session.execute(text("BEGIN IMMEDIATE"))
+            entries = []
+            for _ids in split_into_chunks(list(ids), DB_CHUNK_SIZE):
+                query = self._claimable_query(session, now).\
+                    filter(Solver.id.in_(_ids))
+                entries.extend(query.all())
+            if len(entries) != len(ids):
+                raise ValueError("%d of %d solvers are not claimable any "
+                                 "more" % (len(ids) - len(entries),
+                                           len(ids)))
+            position = dict((_id, idx) for idx, _id in enumerate(ids))
+            entries.sort(key=lambda entry: position[entry[0].id])
+
+            values = self._claim(session, entries, now, lease_expires)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        for solver, _ in entries:
+            for key, value in values.items():
+                setattr(solver, key, value)
+        return entries
+
+    def _claimable_query(self, session, now, tag=None):
+        """
+        Query of solvers which could be claimed: "New" or
+        "ReadytoLaunch" with an expired lease
+        """
+        query = session.query(Solver, Event).join(Event).filter(or_(
+            Solver.status == statusobj.new,
+            and_(Solver.status == statusobj.ready_to_launch,
+                 Solver.lease_expires != None,  # NOQA
+                 Solver.lease_expires < now)))
+        if tag is not None:
+            query = query.filter(Solver.tag == tag)
+        return query
+
+    def _query_claimable(self, session, now, n, tag=None, batch_size=None):
+        """
+        At most n claimable solvers, ordered by id. If batch_size is
+        given, the number is rounded down to a multiple of batch_size.
+        """
+        query = self._claimable_query(session, now, tag=tag).\
+            order_by(Solver.id)
+        if n is not None and n > 0:
+            query = query.limit(n)
+        entries = query.all()
+        if batch_size is not None:
+            entries = entries[:(len(entries) // batch_size) * batch_size]
+        return entries
+
+    def _claim(self, session, entries, now, lease_expires):
+        values = {"status": statusobj.ready_to_launch,
+                  "owner": self.owner, "claimed_at": now,
+                  "lease_expires": lease_expires}
+        ids = [solver.id for solver, _ in entries]
+        for _ids in split_into_chunks(ids, DB_CHUNK_SIZE):
+            update_status(
+                session.query(Solver).filter(Solver.id.in_(_ids)),
+                values, self.actor, now)
+
+        # detach the objects so they keep loaded values after commit
+        session.expunge_all()
+        return values
+
+    @metrics.timed("db.update")
+    def _update_claims(self, entries, values, status, unconfirmed=False,
+                       all_or_nothing=False):
+        """
+        Update the claims of self.owner in entries. If unconfirmed,
+        only claims not confirmed yet are updated. If all_or_nothing,
+        nothing is updated unless all of them are.
+
+        Returns the number of claims updated.
+        """
+        ids = [solver.id for solver, _ in entries]
+        nupdated = 0
+        session = self.Session()
+        try:
+            if all_or_nothing:
+                session.execute(text("BEGIN IMMEDIATE"))
+            for _ids in split_into_chunks(ids, DB_CHUNK_SIZE):
+                query = session.query(Solver).\
+                    filter(Solver.id.in_(_ids)).\
+                    filter(Solver.status == status).\
+                    filter(Solver.owner == self.owner)
+                if unconfirmed:
+                    query = query.filter(Solver.lease_expires.isnot(None))
+                nupdated += update_status(query, values, self.actor)
+            if all_or_nothing and nupdated != len(ids):
+                session.rollback()
+                return 0
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return nupdated
+
+    def renew_claims(self, entries):
+        """
+        Extend the lease of the unconfirmed claims in entries, so they
+        are not re-claimed while the job folder is still being created.
+        Returns the number of claims renewed(claims lost, for example
+        taken over after the lease expired, are not).
+        """
+        values = {"lease_expires": datetime.utcnow() + self.lease_time}
+        return self._update_claims(entries, values,
+                                   statusobj.ready_to_launch,
+                                   unconfirmed=True)
+
+    def confirm_claims(self, entries):
+        """
+        Mark the claims in entries as finished(job folder created), so
+        they are no longer re-claimable after the lease expires. Claims
+        are confirmed all together, or none if any of them is lost.
+        Returns the number of claims confirmed.
+        """
+        return self._update_claims(
+            entries, {"lease_expires": None}, statusobj.ready_to_launch,
+            all_or_nothing=True)
+
+    def release_claims(self, entries):
+        """
+        Return the claimed solvers in entries to "New"
+        """
+        values = {"status": statusobj.new, "owner": None,
+                  "claimed_at": None, "lease_expires": None}
+        return self._update_claims(
+            entries, values, statusobj.ready_to_launch)
+
+    def _unconfirmed_claims_query(self, session, ids, owner, now,
+                                  force=False):
+        """
+        Solvers in ids claimed but not confirmed yet(job folder not
+        created), whose lease expired. If force, also the claims of
+        owner whose lease has not expired(the owner could be still
+        running).
+        """
+        query = session.query(Solver, Event).join(Event).\
+            filter(Solver.id.in_(ids)).\
+            filter(Solver.status == statusobj.ready_to_launch).\
+            filter(Solver.lease_expires.isnot(None))
+        if force:
+            return query.filter(or_(Solver.owner == owner,
+                                    Solver.lease_expires < now))
+        return query.filter(Solver.lease_expires < now)
+
+    @metrics.timed("db.claim")
+    def take_over_claims(self, ids, owner, force=False):
+        """
+        Take over the unconfirmed and expired claims of solvers with
+        ids(for example, made by a crashed job creation), with a new
+        lease. If force, unexpired claims of owner are also taken over.
+        If any of them is not such a claim, nothing is taken over and
+        ValueError is raised.
+
+        Returns a list of (Solver, Event), in the order of ids.
+        """
+        now = datetime.utcnow()
+        values = {"owner": self.owner, "claimed_at": now,
+                  "lease_expires": now + self.lease_time}
+
+        session = self.Session()
+        try:
+            session.execute(text("BEGIN IMMEDIATE"))
+            entries = []
+            for _ids in split_into_chunks(list(ids), DB_CHUNK_SIZE):
+                entries.extend(self._unconfirmed_claims_query(
+                    session, _ids, owner, now, force=force).all())
+            if len(entries) != len(ids):
+                raise ValueError("%d of %d solvers are not unconfirmed "
+                                 "and expired claims(of %s)"
+                                 % (len(ids) - len(entries), len(ids),
+                                    owner))
+            position = dict((_id, idx) for idx, _id in enumerate(ids))
+            entries.sort(key=lambda entry: position[entry[0].id])
+
+            for _ids in split_into_chunks(list(ids), DB_CHUNK_SIZE):
+                update_status(
+                    session.query(Solver).filter(Solver.id.in_(_ids)),
+                    values, self.actor, now)
+            session.expunge_all()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        for solver, _ in entries:
+            for key, value in values.items():
+                setattr(solver, key, value)
+        return entries
+
+    def count_live_solvers(self, ids):
+        """
+        Number of solvers in ids whose claims are confirmed(job folder
+        created), or which are queued, running or done
+        """
+        nlive = 0
+        session = self.Session()
+        try:
+            for _ids in split_into_chunks(list(ids), DB_CHUNK_SIZE):
+                nlive += session.query(Solver).\
+                    filter(Solver.id.in_(_ids)).\
+                    filter(or_(
+                        and_(Solver.status == statusobj.ready_to_launch,
+                             Solver.lease_expires.is_(None)),
+                        Solver.status.in_(RESET_EXCLUDED_STATUS))).count()
+        finally:
+            session.close()
+        return nlive
+
+    def get_job_dir_solver_ids(self, job_dir):
+        """ Ids of solvers of events listed in the job dir """
+        eventnames = read_job_eventnames(job_dir)
+        ids = []
+        session = self.Session()
+        try:
+            for names in split_into_chunks(eventnames, DB_CHUNK_SIZE):
+                ids.extend(row[0] for row in session.query(Solver.id).
+                           join(Event).filter(Event.eventname.in_(names)))
+        finally:
+            session.close()
+        return ids
+
+    def count_confirmed_claims(self, ids, owner):
+        """ Number of solvers in ids claimed by owner and confirmed """
+        nconfirmed = 0
+        session = self.Session()
+        try:
+            for _ids in split_into_chunks(list(ids), DB_CHUNK_SIZE):
+                nconfirmed += session.query(Solver).\
+                    filter(Solver.id.in_(_ids)).\
+                    filter(Solver.status == statusobj.ready_to_launch).\
+                    filter(Solver.lease_expires.is_(None)).\
+                    filter(Solver.owner == owner).count()
+        finally:
+            session.close()
+        return nconfirmed
+
+    @metrics.timed("db.update")
+    def release_unconfirmed_claims(self, ids, owner, force=False):
+        """
+        Return the unconfirmed and expired claims of solvers with ids
+        to "New"(if force, also unexpired claims of owner). All or
+        nothing: if any of the solvers is not such a claim, nothing is
+        released. Returns the number of solvers released.
+        """
+        now = datetime.utcnow()
+        values = {"status": statusobj.new, "owner": None,
+                  "claimed_at": None, "lease_expires": None}
+        nreleased = 0
+        session = self.Session()
+        try:
+            session.execute(text("BEGIN IMMEDIATE"))
+            nclaimed = 0
+            for _ids in split_into_chunks(list(ids), DB_CHUNK_SIZE):
+                nclaimed += self._unconfirmed_claims_query(
+                    session, _ids, owner, now, force=force).count()
+            if nclaimed != len(ids):
+                session.rollback()
+                return 0
+            for _ids in split_into_chunks(list(ids), DB_CHUNK_SIZE):
+                nreleased += update_status(
+                    session.query(Solver).filter(Solver.id.in_(_ids)),
+                    values, self.actor, now)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return nreleased
+
+    def retrieve_new_entries_from_db(self, tag=None, num_to_fetch=None,
+                                     max_jobs=None, single_pass=True):
+        """
+        Claim new entries from database and split them into jobs, each
+        with num_to_fetch entries. Entries not enough to fill up a job
+        are left as "New".
+
+        If single_pass, all entries(at most max_jobs * num_to_fetch)
+        are claimed by one query and one transaction, then partitioned
+        in memory. Otherwise, entries are claimed job by job.
+
+        Returns a list of entries of each job.
+        """
+        if not single_pass:
+            return self._retrieve_new_entries_by_job(
+                tag=tag, num_to_fetch=num_to_fetch, max_jobs=max_jobs)
 
-    def retrieve_new_entries_from_db(self, tag=None, num_to_fetch=None):
+        if max_jobs is None:
+            n = None
+        else:
+            n = max_jobs * num_to_fetch
+        entries = self.claim_batch(n, tag=tag, batch_size=num_to_fetch)
+        if len(entries) == 0:
+            return []
+
+        try:
+            validate_entries(entries)
+        except ValueError:
+            self.release_claims(entries)
+            raise
+
+        return split_into_chunks(entries, num_to_fetch)
+
+    def _retrieve_new_entries_by_job(self, tag=None, num_to_fetch=None,
+                                     max_jobs=None):
         job_entries = []
-        while True:
-            entries = self.fetch_with_status(
-                statusobj.new, tag=tag, num_to_fetch=num_to_fetch)
-            if len(entries) < num_to_fetch:
+        while max_jobs is None or len(job_entries) < max_jobs:
+            entries = self.claim_batch(
+                num_to_fetch, tag=tag, allow_partial=False)
+            if len(entries) == 0:
                 break
-            validate_entries(entries)
-            self.update_with_status(entries, status=statusobj.ready_to_launch)
+            try:
+                validate_entries(entries)
+            except ValueError:
+                self.release_claims(entries)
+                raise
             job_entries.append(entries)
 
         return job_entries
@@ -228,91 +783,518 @@ class ForwardSolver(ForwardManager):
     """
     Forward job creator
     """
-    def get_new_entries(self):
-        print(make_title("Retrieve jobs from DB"))
+    def get_num_entries_per_job(self):
         n_serial = self.config["job_config"]["n_serial"]
         n_simul = self.config["job_config"]["nevents_per_simul_run"]
         num_to_fetch = n_serial * n_simul
         print("n_serial * n_simul = n_total: %d * %d = %d"
               % (n_serial, n_simul, num_to_fetch))
+        return num_to_fetch
 
-        runbase = self.config["runbase_info"]["runbase"]
+    def get_job_base(self):
+        return os.path.join(self.config["runbase_info"]["runbase"], "jobs")
+
+    def get_job_dirs(self, njobs):
+        """
+        Names of the next njobs job dirs, numbered after the existing
+        ones(see allocate_job_dirs). The dirs are not reserved.
+        """
+        job_prefix = self.config["runbase_info"]["job_folder_prefix"]
+        start = get_max_job_index(self.get_job_base(), job_prefix) + 1
+        return [get_job_dir(self.get_job_base(), job_prefix, idx)
+                for idx in range(start, start + njobs)]
+
+    def get_new_entries(self, max_jobs=None):
+        """
+        Claim new entries for jobs, and reserve a new job dir for each
+        job(see allocate_job_dirs). If the job dirs could not be
+        reserved, the claims are released.
+        """
+        print(make_title("Retrieve jobs from DB"))
+        num_to_fetch = self.get_num_entries_per_job()
         job_entries = self.retrieve_new_entries_from_db(
-            num_to_fetch=num_to_fetch)
-        job_base = os.path.join(runbase, "jobs")
+            num_to_fetch=num_to_fetch, max_jobs=max_jobs)
         njobs = len(job_entries)
         print("Number of jobs: %d" % njobs)
 
-        job_prefix = self.config["runbase_info"]["job_folder_prefix"]
-        job_dirs = [
-            os.path.join(job_base, "job_%s_%02d" % (job_prefix, idx+1))
-            for idx in range(njobs)]
-        check_folders_exist(job_dirs)
+        try:
+            job_dirs = allocate_job_dirs(
+                self.get_job_base(),
+                self.config["runbase_info"]["job_folder_prefix"], njobs)
+        except BaseException:
+            for _entries in job_entries:
+                self.release_claims(_entries)
+            raise
         return job_dirs, job_entries
 
-    def create_jobs(self):
-        config = self.config
+    def plan_jobs(self, max_jobs=None, tag=None):
+        """
+        Dry run of create_jobs: plan the jobs for the solvers which
+        would be claimed now, without claiming them or touching any
+        file(the database could be opened read only, see
+        create_db_connection). See job_planner.make_forward_plan.
+        """
+        print(make_title("Plan jobs from DB"))
+        num_to_fetch = self.get_num_entries_per_job()
+        n = None if max_jobs is None else max_jobs * num_to_fetch
+
+        session = self.Session()
+        try:
+            with metrics.timer("db.fetch"):
+                entries = self._query_claimable(
+                    session, datetime.utcnow(), n, tag=tag,
+                    batch_size=num_to_fetch)
+        finally:
+            session.close()
+
+        job_entries = split_into_chunks(entries, num_to_fetch)
+        job_dirs = self.get_job_dirs(len(job_entries))
+        specfem_base = os.path.join(
+            self.config["runbase_info"]["runbase"], "specfem3d_globe")
+        check_specfem(specfem_base)
+        return make_forward_plan(self.config, job_dirs, job_entries,
+                                 specfem_base)
 
-        runbase = config["runbase_info"]["runbase"]
+    def create_jobs(self, max_jobs=None, workers=1):
+        """
+        Create job folders for new entries. If workers > 1, the entry
+        directories(across all jobs) and then the job folders are
+        created by a pool of workers(threads), with progress reported
+        in order. Each job is recorded in the job journal, so if the
+        creation fails, unfinished jobs could be resumed(resume_jobs)
+        or rolled back(rollback_jobs).
+        """
+        runbase = self.config["runbase_info"]["runbase"]
         specfem_base = os.path.join(runbase, "specfem3d_globe")
         check_specfem(specfem_base)
 
-        job_dirs, job_entries = self.get_new_entries()
+        job_dirs, job_entries = self.get_new_entries(max_jobs=max_jobs)
+        self._create_job_folders(job_dirs, job_entries, specfem_base,
+                                 workers=workers)
+
+    def create_jobs_from_plan(self, plan, workers=1, on_exist="ask"):
+        """
+        Create the jobs of a plan(see plan_jobs), as they are planned.
+        The planned solvers are claimed all together; if any of them
+        was claimed or changed since planning, nothing is done and
+        ValueError is raised.
+        """
+        specfem_base = plan["specfem_base"]
+        check_specfem(specfem_base)
+
+        print(make_title("Claim planned jobs from DB"))
+        ids = [_id for job in plan["jobs"] for _id in job["solver_ids"]]
+        entries = self.claim_ids(ids)
+        print("Number of jobs: %d" % len(plan["jobs"]))
+
+        job_dirs = [job["job_dir"] for job in plan["jobs"]]
+        job_entries = split_by_sizes(
+            entries, [len(job["solver_ids"]) for job in plan["jobs"]])
+        reserved = []
+        try:
+            for _entries in job_entries:
+                validate_entries(_entries)
+            # reserve the planned job dirs not taken yet
+            for job_dir in job_dirs:
+                if reserve_job_dir(job_dir):
+                    reserved.append(job_dir)
+            existing = [d for d in job_dirs if d not in reserved]
+            live = self.get_live_job_dirs(existing)
+            if len(live) > 0:
+                raise ValueError("Job dirs of the plan belong to live jobs, "
+                                 "not removed: %s" % live)
+            check_folders_exist(existing, action=on_exist)
+        except BaseException:
+            for _entries in job_entries:
+                self.release_claims(_entries)
+            for job_dir in reserved:
+                os.rmdir(job_dir)
+            raise
+        self._create_job_folders(job_dirs, job_entries, specfem_base,
+                                 workers=workers)
+
+    def get_live_job_dirs(self, job_dirs):
+        """
+        Existing job dirs of live jobs, which must not be removed: jobs
+        completed in the job journal, or with solvers whose claims are
+        confirmed(or queued, running or done)
+        """
+        states = load_job_states(
+            get_job_journal_file(self.config["runbase_info"]))
+        live = []
+        for job_dir in job_dirs:
+            if not os.path.exists(job_dir):
+                continue
+            job = states.get(job_dir)
+            if job is not None and job["state"] == "completed":
+                live.append(job_dir)
+                continue
+            if job is not None:
+                ids = job["solver_ids"]
+            elif os.path.exists(os.path.join(job_dir, "_XEVENTID.all")):
+                ids = self.get_job_dir_solver_ids(job_dir)
+            else:
+                ids = []
+            if self.count_live_solvers(ids) > 0:
+                live.append(job_dir)
+        return live
+
+    def resume_jobs(self, workers=1, force=False):
+        """
+        Finish the unfinished jobs in the job journal: their claims are
+        taken over(see take_over_claims) and the steps already done are
+        skipped. Jobs whose claims are not expired(unless force) or
+        changed are skipped. Returns the number of jobs resumed.
+        """
+        runbase_info = self.config["runbase_info"]
+        specfem_base = os.path.join(runbase_info["runbase"],
+                                    "specfem3d_globe")
+        check_specfem(specfem_base)
+
+        print(make_title("Resume jobs from journal"))
+        jobs = get_unfinished_jobs(
+            load_job_states(get_job_journal_file(runbase_info)))
+        print("Number of unfinished jobs: %d" % len(jobs))
+        if len(jobs) == 0:
+            return 0
+
+        job_dirs = []
+        job_entries = []
+        with JobJournal(get_job_journal_file(runbase_info)) as journal:
+            for job_dir, job in jobs.items():
+                if self._is_confirmed(job):
+                    # crashed after the claims were confirmed
+                    journal.record("completed", job_dir)
+                    continue
+                try:
+                    entries = self.take_over_claims(
+                        job["solver_ids"], job["owner"], force=force)
+                except ValueError as exc:
+                    print("Skip job %s: %s(use force if the owner is not "
+                          "running)" % (job_dir, exc))
+                    continue
+                journal.record("resumed", job_dir, owner=self.owner)
+                job_dirs.append(job_dir)
+                job_entries.append(entries)
+
+        self._create_job_folders(
+            job_dirs, job_entries, specfem_base, workers=workers,
+            done_steps=dict((job_dir, job["steps"])
+                            for job_dir, job in jobs.items()))
+        return len(job_dirs)
+
+    def _is_confirmed(self, job):
+        """ True if all claims of the journaled job are confirmed """
+        return self.count_confirmed_claims(
+            job["solver_ids"], job["owner"]) == len(job["solver_ids"])
+
+    def rollback_jobs(self, force=False):
+        """
+        Roll back the unfinished jobs in the job journal: their
+        unconfirmed claims are returned to "New" and their job folders
+        are removed. Only jobs whose claims are all released are
+        removed: claims not expired(unless force) or changed are kept
+        with their job folders. Jobs whose claims are all confirmed are
+        recorded as completed. Returns the number of solvers released.
+        """
+        runbase_info = self.config["runbase_info"]
+        journal_file = get_job_journal_file(runbase_info)
+
+        print(make_title("Roll back jobs from journal"))
+        jobs = get_unfinished_jobs(load_job_states(journal_file))
+        print("Number of unfinished jobs: %d" % len(jobs))
+
+        nreleased = 0
+        with JobJournal(journal_file) as journal:
+            for job_dir, job in jobs.items():
+                if self._is_confirmed(job):
+                    journal.record("completed", job_dir)
+                    print("%s: claims confirmed, job kept" % job_dir)
+                    continue
+                n = self.release_unconfirmed_claims(
+                    job["solver_ids"], job["owner"], force=force)
+                if n != len(job["solver_ids"]):
+                    print("Skip job %s: claims not expired or changed(use "
+                          "force if the owner is not running)" % job_dir)
+                    continue
+                if os.path.exists(job_dir):
+                    shutil.rmtree(job_dir)
+                journal.record("rolled_back", job_dir, released=n)
+                print("%s: %d claims released, job dir removed"
+                      % (job_dir, n))
+                nreleased += n
+        return nreleased
+
+    def _create_job_folders(self, job_dirs, job_entries, specfem_base,
+                            workers=1, done_steps=None):
+        """
+        Create the entry dirs and job folders of jobs(claimed), and
+        confirm the claims. Jobs are recorded in the job journal as
+        planned(unless done_steps is given, when resuming), then with
+        each step done. Steps in done_steps({job_dir: [step]}) are
+        skipped. The lease of the claims is renewed after each step. If
+        it fails(also if claims of a job are lost), the claims are
+        kept, so the unfinished jobs could be resumed or rolled back.
+        """
+        config = self.config
+        store = get_artifact_store(config["runbase_info"])
+        if store is not None:
+            print("Artifact store(%s): %s" % (store.mode, store.root))
+
+        journal = JobJournal(get_job_journal_file(config["runbase_info"]))
+        if done_steps is None:
+            done_steps = {}
+            for _dir, _entries in zip(job_dirs, job_entries):
+                journal.record(
+                    "planned", _dir, owner=self.owner,
+                    solver_ids=[solver.id for solver, _ in _entries])
+
+        def _renew_claims(_dir, _entries):
+            if self.renew_claims(_entries) != len(_entries):
+                raise ValueError("Claims of job %s lost(lease expired and "
+                                 "taken over, or reset)" % _dir)
+
+        def _create_job_folder(job):
+            _dir, _entries = job
+            _renew_claims(_dir, _entries)
+            if "job_folder" not in done_steps.get(_dir, []):
+                with metrics.timer("job.create"):
+                    create_job_folder(_dir, _entries, config, specfem_base,
+                                      store=store)
+            return job
+
+        # index of job for each entry to set up, and number of entries
+        # left to set up for each job
+        entry_jobs = []
+        nleft = [0] * len(job_dirs)
+        for idx, (_dir, _entries) in enumerate(zip(job_dirs, job_entries)):
+            if "entry_dirs" not in done_steps.get(_dir, []):
+                entry_jobs.extend([idx] * len(_entries))
+                nleft[idx] = len(_entries)
+
+        def _entry_done(entry_idx):
+            idx = entry_jobs[entry_idx]
+            nleft[idx] -= 1
+            if nleft[idx] == 0:
+                journal.record("step", job_dirs[idx], step="entry_dirs")
+                _renew_claims(job_dirs[idx], job_entries[idx])
 
         njobs = len(job_entries)
-        idx = 0
-        for _dir, _entries in zip(job_dirs, job_entries):
-            idx += 1
-            print(make_title("Create job[%d/%d]" % (idx, njobs)))
-            print("job dir: %s" % _dir)
-            print("Number of entries: %d" % len(_entries))
-            setup_entry_dir(_entries, specfem_base)
-            create_job_folder(_dir, _entries, config, specfem_base)
+        ncompleted = 0
+        try:
+            print(make_title("Setup entry dirs(%d workers)" % workers))
+            all_entries = [
+                entry for _dir, _entries in zip(job_dirs, job_entries)
+                if "entry_dirs" not in done_steps.get(_dir, [])
+                for entry in _entries]
+            setup_entry_dir(all_entries, specfem_base, workers=workers,
+                            store=store, callback=_entry_done)
+
+            jobs = parallel_map(_create_job_folder,
+                                zip(job_dirs, job_entries), workers=workers)
+            for idx, (_dir, _entries) in enumerate(jobs):
+                print(make_title("Create job[%d/%d]" % (idx+1, njobs)))
+                print("job dir: %s" % _dir)
+                print("Number of entries: %d" % len(_entries))
+                journal.record("step", _dir, step="job_folder")
+                if self.confirm_claims(_entries) != len(_entries):
+                    raise ValueError(
+                        "Claims of job %s lost before confirmed, job not "
+                        "completed" % _dir)
+                journal.record("completed", _dir)
+                ncompleted += 1
+                metrics.count("job.created")
+                metrics.count("job.entries", len(_entries))
+        except BaseException:
+            print("Failed to create jobs, %d jobs unfinished. Resume them "
+                  "with 'create_jobs --resume' or release their claims "
+                  "with 'create_jobs --rollback'(add --force before their "
+                  "lease expires)" % (njobs - ncompleted))
+            raise
+        finally:
+            journal.close()
+
+
+def get_job_dir(job_base, job_prefix, idx):
+    return os.path.join(job_base, "job_%s_%02d" % (job_prefix, idx))
 
 
-def reset_forward_job(db_name):
+def get_max_job_index(job_base, job_prefix):
+    """ Max index of the existing job dirs "job_<prefix>_<index>" """
+    pattern = re.compile(r"^job_%s_(\d+)$" % re.escape(job_prefix))
+    max_idx = 0
+    if os.path.isdir(job_base):
+        for name in os.listdir(job_base):
+            match = pattern.match(name)
+            if match:
+                max_idx = max(max_idx, int(match.group(1)))
+    return max_idx
+
+
+def reserve_job_dir(job_dir):
     """
-    reset forward table entries, whose status is not "Done" to "New"
-    so jobs could be re-fetched and re-launched later
+    Make the job dir by os.mkdir, which fails if the dir exists(also
+    if made by another process at the same time). Returns True if made,
+    or False if it exists.
     """
-    if not os.path.exists(db_name):
-        raise ValueError("No db exists: %s" % db_name)
+    safe_makedir(os.path.dirname(job_dir))
+    try:
+        os.mkdir(job_dir)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+        return False
+    return True
+
+
+def allocate_job_dirs(job_base, job_prefix, njobs):
+    """
+    Reserve njobs new job dirs "job_<prefix>_<index>" under job_base,
+    numbered after the existing ones. Each dir is made by os.mkdir,
+    which fails if the dir exists, so job creators running at the same
+    time never get the same dir.
+    """
+    idx = get_max_job_index(job_base, job_prefix)
+    job_dirs = []
+    while len(job_dirs) < njobs:
+        idx += 1
+        job_dir = get_job_dir(job_base, job_prefix, idx)
+        if reserve_job_dir(job_dir):
+            job_dirs.append(job_dir)
+    return job_dirs
+
+
+def split_by_sizes(items, sizes):
+    """ Split a list into consecutive chunks of sizes """
+    chunks = []
+    start = 0
+    for size in sizes:
+        chunks.append(items[start:start+size])
+        start += size
+    return chunks
+
+
+def read_job_eventnames(job_dir):
+    """ Read eventnames of a job from its "_XEVENTID.all" file """
+    fn = os.path.join(job_dir, "_XEVENTID.all")
+    if not os.path.exists(fn):
+        raise ValueError("No eventlist file in job dir: %s" % fn)
+    return [x for x in read_txt_into_list(fn) if len(x) > 0]
 
-    engine = create_engine('sqlite:///%s' % db_name, echo=False)
-    Session = sessionmaker(bind=engine)
+
+def reset_forward_job(db_name, statuses=None, tag=None, id_range=None,
+                      job_dir=None, dry_run=False, db_options=None):
+    """
+    reset forward table entries to "New" so jobs could be re-fetched and
+    re-launched later. Entries are selected by:
+    1) statuses: list of status to reset. If None, all entries which
+       are not "New", "ReadytoLaunch", "Done", "Running" or "Queued"
+       (entries with NULL status included). Jobs of "ReadytoLaunch"
+       entries may be waiting to run or running, so they are only
+       reset if asked explicitly;
+    2) tag: only entries with this tag;
+    3) id_range: (start, end) of solver ids, both ends included;
+    4) job_dir: only entries of events in this job folder(listed in
+       its "_XEVENTID.all" file).
+    The reset is done by a single UPDATE statement, and the cached
+    validation verdicts of their runs are dropped(the runs will be
+    overwritten). If dry_run, only count the entries to be reset.
+
+    Returns the number of entries reset(or to be reset in dry run).
+    """
+    _, Session = create_db_connection(db_name, db_options)
 
     session = Session()
-    entries = session.query(Solver).all()
-    nresets = 0
-    for entry in entries:
-        if entry.status != statusobj.done:
-            nresets += 1
-            entry.status = statusobj.new
-
-    session.commit()
-    session.close()
-    print("Reset entries to new: %d/%d" % (nresets, len(entries)))
+    query = session.query(Solver)
+    if statuses:
+        query = query.filter(Solver.status.in_(statuses))
+    else:
+        excluded = RESET_EXCLUDED_STATUS + [statusobj.new,
+                                            statusobj.ready_to_launch]
+        query = query.filter(or_(~Solver.status.in_(excluded),
+                                 Solver.status.is_(None)))
+    if tag is not None:
+        query = query.filter(Solver.tag == tag)
+    if id_range is not None:
+        query = query.filter(Solver.id.between(id_range[0], id_range[1]))
+    if job_dir is not None:
+        eventnames = read_job_eventnames(job_dir)
+        event_ids = session.query(Event.id).\
+            filter(Event.eventname.in_(eventnames))
+        query = query.filter(Solver.event_id.in_(event_ids))
+
+    counts = dict(query.with_entities(Solver.status, func.count(Solver.id)).
+                  group_by(Solver.status).all())
+    print("Entries to be reset: %s" % counts)
 
+    if dry_run:
+        nresets = sum(counts.values())
+        print("Dry run. Entries to be reset to new: %d" % nresets)
+        session.close()
+        return nresets
+
+    try:
+        session.query(ValidationCache).filter(
+            ValidationCache.runbase.in_(
+                query.with_entities(Solver.runbase))).\
+            delete(synchronize_session=False)
+        nresets = update_status(
+            query, {"status": statusobj.new, "owner": None,
+                    "claimed_at": None, "lease_expires": None},
+            "reset_forward_job@%s" % get_default_owner())
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
-def check_forward_job(db_name):
+    print("Reset entries to new: %d" % nresets)
+    return nresets
+
+
+def get_status_summary(session, by_tag=False, cached=True):
     """
-    check and stats the status of forward jobs in the forward table.
+    Count solvers for each status(and tag, if by_tag). If cached,
+    counts are read from the solver_status_count table. Otherwise
+    they are computed by a "GROUP BY status, tag" query.
+
+    Returns {status: count}, or {tag: {status: count}} if by_tag.
     """
-    if not os.path.exists(db_name):
-        raise ValueError("No db exists: %s" % db_name)
+    if cached:
+        query = session.query(
+            SolverStatusCount.status, SolverStatusCount.tag,
+            SolverStatusCount.count).filter(SolverStatusCount.count > 0)
+    else:
+        query = session.query(
+            Solver.status, Solver.tag, func.count(Solver.id)).\
+            group_by(Solver.status, Solver.tag)
 
-    engine = create_engine('sqlite:///%s' % db_name, echo=False)
-    Session = sessionmaker(bind=engine)
+    results = {}
+    for status, tag, count in query:
+        if by_tag:
+            results.setdefault(tag or None, {})
+            _results = results[tag or None]
+        else:
+            _results = results
+        _results[status] = _results.get(status, 0) + count
+    return results
+
+
+def check_forward_job(db_name, by_tag=False, cached=True, db_options=None):
+    """
+    check and stats the status of forward jobs in the forward table.
+    """
+    _, Session = create_db_connection(db_name, db_options)
 
     session = Session()
-    entries = session.query(Solver).all()
+    results = get_status_summary(session, cached=cached)
+    if by_tag:
+        tag_results = get_status_summary(session, by_tag=True, cached=cached)
     session.close()
 
-    results = {}
-    for entry in entries:
-        if entry.status not in results:
-            results[entry.status] = 0
-        results[entry.status] += 1
-
     print("Current status in Forward tables: %s" % results)
+    if by_tag:
+        for tag in sorted(tag_results, key=str):
+            print("Tag(%s): %s" % (tag, tag_results[tag]))
     return results
@@ -2,33 +2,79 @@
 from __future__ import print_function, division, absolute_import
 import os
 import time
+import signal
+import threading
 import math
-import glob
-from collections import defaultdict
+import random
+import fnmatch
+import hashlib
+import calendar
+from datetime import datetime
+from collections import defaultdict, namedtuple
 
 from . import statusobj
-from .io import bp_validator, hdf5_validator, read_txt_into_list, dump_json
-from .forward_manager import ForwardManager, check_forward_job
+from . import metrics
+from . import io
+from .io import bp_validator, asdf_waveform_validator, load_json, \
+    dump_json, read_station_names, read_asdf_station_names, \
+    scan_asdf_waveforms
+from .utils import parallel_map, split_into_chunks
+from .db import ValidationCache
+from .forward_manager import ForwardManager, check_forward_job, \
+    DB_CHUNK_SIZE
+from .validation_log import ValidationLogWriter, get_validation_log_file
+
+
+# minimal solver information needed by validation
+SolverInfo = namedtuple("SolverInfo", ["id", "runbase", "status"])
+
+# number of bytes read from the end of output_solver.txt to find
+# "End of the simulation"
+OUTPUT_SOLVER_TAIL_SIZE = 4096
+
+# number of saved forward wavefield files, if no reference is learned
+DEFAULT_NUM_WAVEFIELDS = 26
+
+# reference of saved forward wavefields, under runbase
+WAVEFIELD_REFERENCE_FILE = "wavefield_reference.json"
+
+# number of traces(components) expected for each station in
+# synthetic.h5, could be overwritten by "ncomponents" in
+# config["simulation"]
+DEFAULT_NCOMPONENTS = 3
+
+# status of solvers watched in watch mode(launched, but not validated)
+WATCH_STATUS = [statusobj.ready_to_launch, statusobj.queued,
+                statusobj.running]
+
+STRAIN_CHECKPOINT_KEYS = (
+    b"Max of strain, eps_trace_over_3_crust_mantle",
+    b"Max of strain, epsilondev_crust_mantle")
 
 
 class Error(object):
     """ Local Error Message Class """
-    def __init__(self, code, old_status=None, new_status=None, msg=None):
+    def __init__(self, code, old_status=None, new_status=None, msg=None,
+                 info=None):
         self.code = code
         self.old_status = old_status
         self.new_status = new_status
         self.msg = msg
+        self.info = info
 
     def to_dict(self):
         return {"code": self.code, "old_status": self.old_status,
-                "new_status": self.new_status, "msg": self.msg}
+                "new_status": self.new_status, "msg": self.msg,
+                "info": self.info}
 
     def __repr__(self):
         return "Error(code=%d, old_status=%s, new_status=%s, msg=%s)" \
             % (self.code, self.old_status, self.new_status, self.msg)
 
 
-def validate_forward_simulation(solver, save_forward, mode=1):
+def validate_forward_simulation(solver, save_forward, mode=1,
+                                reference=None, deep_check=True,
+                                ncomponents=DEFAULT_NCOMPONENTS):
     runbase = solver.runbase
 
     # check the "OUTPUT_FILES/output_solver.txt"
@@ -37,20 +83,89 @@ def validate_forward_simulation(solver, save_forward, mode=1):
     err = validate_output_solver_txt(output_solver_txt)
     if err.code != 0:
         return err
+    info = err.info
 
     # check the "OUTPUT_FILES/synthetic.h5"
     output_asdf = os.path.join(runbase, "OUTPUT_FILES", "synthetic.h5")
-    err = validate_synt_asdf_file(output_asdf, mode=mode)
+    stationfile = os.path.join(runbase, "DATA", "STATIONS")
+    err = validate_synt_asdf_file(output_asdf, mode=mode,
+                                  stationfile=stationfile,
+                                  ncomponents=ncomponents)
     if err.code != 0:
-        return err.msg
+        return err
+    if err.info is not None:
+        info.update(err.info)
 
     # check the output wavefield
     if save_forward:
-        err = validate_wavefield(runbase, mode=mode)
+        err = validate_wavefield(runbase, mode=mode, reference=reference,
+                                 deep_check=deep_check)
         if err.code != 0:
             return err
 
-    return Error(0, new_status=statusobj.done, msg="valid")
+    return Error(0, new_status=statusobj.done, msg="valid", info=info)
+
+
+def _parse_last_value(line, convert=float):
+    try:
+        return convert(line.split(b"=")[-1].split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def read_file_tail(filename, size=OUTPUT_SOLVER_TAIL_SIZE):
+    """ Read the last size bytes of a file """
+    with open(filename, "rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        fh.seek(max(fh.tell() - size, 0))
+        return fh.read()
+
+
+@metrics.timed("validate.txt_parse")
+def parse_output_solver_txt(output_solver_txt):
+    """
+    Parse output_solver.txt of specfem3d_globe without loading the
+    whole file:
+    1) the tail of the file is read to check "End of the simulation"
+       and get the total elapsed time;
+    2) the strain checkpoint lines are scanned in one buffered pass,
+       which stops at the first NAN or INF value.
+
+    Returns a dict with keys finished, unstable, checkpoints,
+    last_time_step, elapsed_time_in_seconds and
+    total_elapsed_time_in_seconds(values are None if not found).
+    """
+    info = {"finished": False, "unstable": False, "checkpoints": 0,
+            "last_time_step": None, "elapsed_time_in_seconds": None,
+            "total_elapsed_time_in_seconds": None}
+
+    tail = [line.strip() for line in
+            read_file_tail(output_solver_txt).splitlines()]
+    tail = [line for line in tail if len(line) > 0]
+    if len(tail) > 0 and b"End of the simulation" in tail[-1]:
+        info["finished"] = True
+    for line in tail:
+        if line.startswith(b"Total elapsed time in seconds"):
+            info["total_elapsed_time_in_seconds"] = _parse_last_value(line)
+
+    with open(output_solver_txt, "rb") as fh:
+        for line in fh:
+            if b"Max of strain" in line:
+                if not line.strip().startswith(STRAIN_CHECKPOINT_KEYS):
+                    continue
+                v = _parse_last_value(line)
+                # overflowed values are printed as "****" by fortran
+                if v is None or math.isnan(v) or math.isinf(v):
+                    info["unstable"] = True
+                    break
+                info["checkpoints"] += 1
+            elif b"Time step #" in line:
+                info["last_time_step"] = _parse_last_value(
+                    line.replace(b"#", b"="), convert=int)
+            elif line.lstrip().startswith(b"Elapsed time in seconds"):
+                info["elapsed_time_in_seconds"] = _parse_last_value(line)
+
+    return info
 
 
 def validate_output_solver_txt(output_solver_txt):
@@ -63,44 +178,63 @@ def validate_output_solver_txt(output_solver_txt):
 
     # check no NAN values in output_solver.txt. If there are,
     # then the simulation failed.
-    unstable_flag = False
-    content = read_txt_into_list(output_solver_txt)
-    checkpoint = 0
-    for line in content:
-        if "Max of strain, eps_trace_over_3_crust_mantle" in line:
-            v = float(line.split()[-1])
-            if math.isnan(v) or math.isinf(v):
-                unstable_flag = True
-            checkpoint += 1
-        if "Max of strain, epsilondev_crust_mantle" in line:
-            v = float(line.split()[-1])
-            if math.isnan(v) or math.isinf(v):
-                unstable_flag = True
-            checkpoint += 1
-
-    if unstable_flag:
+    info = parse_output_solver_txt(output_solver_txt)
+    err.info = info
+    if info["unstable"]:
         err.code = 1
         err.new_status = statusobj.unstable_simulation
         err.msg = "Unstable simulation with NAN or INF values"
         return err
 
-    if "End of the simulation" not in content[-2]:
+    if not info["finished"]:
         err.code = 1
         err.new_status = statusobj.unfinished_simulation
         err.msg = "Unfinished simulation"
         return err
 
-    if checkpoint < 2:
+    if info["checkpoints"] < 2:
         err.code = 1
         err.new_status = statusobj.unfinished_simulation
         err.msg = "Less than 2 checkpoint found in output_solver.txt"
         return err
 
-    return Error(0, new_status=statusobj.done, msg="valid")
+    return Error(0, new_status=statusobj.done, msg="valid", info=info)
 
 
-def validate_synt_asdf_file(output_asdf, mode=1):
-    """ check output asdf file """
+@metrics.timed("validate.station_check")
+def validate_station_completeness(output_asdf, stationfile):
+    """
+    Compare stations(NET.STA) in STATIONS file with the waveform groups
+    in the asdf file. Returns the error message if some stations are
+    missing, or None(also if the check could not be done: no
+    STATIONS file or h5py not installed).
+    """
+    if not os.path.exists(stationfile):
+        return None
+    try:
+        asdf_stations = read_asdf_station_names(output_asdf)
+    except (IOError, OSError) as exc:
+        return "Failed to read asdf file: %s" % exc
+    if asdf_stations is None:
+        return None
+
+    missing = read_station_names(stationfile) - asdf_stations
+    if len(missing) > 0:
+        missing = sorted(missing)
+        return "Missing %d stations in asdf file: %s%s" % (
+            len(missing), ", ".join(missing[:10]),
+            ", ..." if len(missing) > 10 else "")
+    return None
+
+
+def validate_synt_asdf_file(output_asdf, mode=1, stationfile=None,
+                            ncomponents=DEFAULT_NCOMPONENTS):
+    """
+    check output asdf file. Mode 1 only checks its existence. In mode
+    2 and 3, if stationfile is given, all the stations in it should
+    be found in the asdf file(the file is opened with h5py). Each
+    station should have ncomponents traces.
+    """
     err = Error(0)
     if not os.path.exists(output_asdf):
         err.code = 1
@@ -108,91 +242,601 @@ def validate_synt_asdf_file(output_asdf, mode=1):
         err.msg = "Missing output asdf file"
         return err
 
-    if mode == 2:
-        _t = time.time()
-        code = hdf5_validator(output_asdf)
+    if mode >= 2 and stationfile is not None:
+        msg = validate_station_completeness(output_asdf, stationfile)
+        if msg is not None:
+            err.code = 1
+            err.new_status = statusobj.incomplete_output
+            err.msg = msg
+            return err
+
+    if mode >= 2:
+        with metrics.timer("validate.hdf5_check"):
+            code, msg, info = asdf_waveform_validator(
+                output_asdf, ncomponents=ncomponents)
         if code != 0:
             err.code = 1
             err.new_status = statusobj.invalid_file
-            err.msg = "hdf5 validator failed"
-        hdf5_t = time.time() - _t
-        print("ASDF file(hdf5) validate time: %.1f" % hdf5_t)
-        return err
+            err.msg = msg
+        err.info = info
+        if err.code != 0 or mode == 2:
+            return err
+
+    if mode >= 3:
+        return validate_synt_waveforms(output_asdf, info=err.info)
 
     return Error(0, new_status=statusobj.done, msg="valid")
 
 
-def validate_wavefield(runbase, mode=1):
-    """ check saved wavefields """
-    err = Error(0)
-    wavefields = glob.glob(os.path.join(runbase, "DATABASES_MPI",
-                                        "save_frame_at*.bp"))
-    wavefields.sort()
-    if len(wavefields) != 26:
+@metrics.timed("validate.waveform_scan")
+def validate_synt_waveforms(output_asdf, info=None):
+    """
+    Scan the waveform data in asdf file: traces with NAN/INF values or
+    zero energy make the file invalid. The summary of the scan is put
+    into info["waveforms"].
+    """
+    err = Error(0, info=info if info is not None else {})
+    summary = scan_asdf_waveforms(output_asdf)
+    err.info["waveforms"] = summary
+
+    nbad = len(summary["nonfinite_traces"]) + len(summary["zero_traces"])
+    if summary["ntraces"] == 0 or nbad > 0:
         err.code = 1
         err.new_status = statusobj.invalid_file
-        err.msg = "Not enough forward wavefiled files: %d < %d" % (
-            len(wavefields), 26)
-        return err
+        err.msg = "Bad waveforms in asdf file: %d traces, %d with NAN " \
+            "or INF values, %d with zero energy" % (
+                summary["ntraces"], len(summary["nonfinite_traces"]),
+                len(summary["zero_traces"]))
+    return err
+
+
+@metrics.timed("file.stat_wavefields")
+def scan_wavefields(runbase):
+    """ Returns {filename: size} of save_frame_at*.bp in DATABASES_MPI """
+    wavefields = {}
+    try:
+        for entry in os.scandir(os.path.join(runbase, "DATABASES_MPI")):
+            if fnmatch.fnmatch(entry.name, "save_frame_at*.bp"):
+                wavefields[entry.name] = entry.stat().st_size
+    except OSError:
+        pass
+    return wavefields
+
+
+def learn_wavefield_reference(runbase):
+    """
+    Learn the reference of saved forward wavefields(file names and
+    sizes) from a run which is known to be good.
+    """
+    wavefields = scan_wavefields(runbase)
+    if len(wavefields) == 0:
+        raise ValueError("No forward wavefield files in run: %s" % runbase)
+    return {"runbase": runbase, "wavefields": wavefields}
+
+
+def check_wavefields_with_reference(wavefields, reference):
+    """
+    Compare the saved forward wavefields({filename: size}) of one run
+    with the reference. Returns the error message, or None if valid.
+    """
+    missing = sorted(set(reference["wavefields"]) - set(wavefields))
+    if len(missing) > 0:
+        return "Missing %d forward wavefield files: %s" % (
+            len(missing), ", ".join(missing))
+
+    truncated = [name for name, size in reference["wavefields"].items()
+                 if wavefields[name] < size]
+    if len(truncated) > 0:
+        return "Truncated forward wavefield files: %s" % (
+            ", ".join(sorted(truncated)))
+
+    return None
+
+
+def validate_wavefield(runbase, mode=1, reference=None, deep_check=True):
+    """
+    check saved wavefields. Only file names and sizes(stat) are
+    checked against the reference, or the number of files if no
+    reference. In mode 2, if deep_check, the last wavefield file is
+    also checked with bpls.
+    """
+    err = Error(0)
+    wavefields = scan_wavefields(runbase)
+    if reference is None:
+        if len(wavefields) != DEFAULT_NUM_WAVEFIELDS:
+            err.code = 1
+            err.new_status = statusobj.invalid_file
+            err.msg = "Not enough forward wavefiled files: %d < %d" % (
+                len(wavefields), DEFAULT_NUM_WAVEFIELDS)
+            return err
+    else:
+        msg = check_wavefields_with_reference(wavefields, reference)
+        if msg is not None:
+            err.code = 1
+            err.new_status = statusobj.invalid_file
+            err.msg = msg
+            return err
 
-    if mode == 2:
-        _t = time.time()
-        code = bp_validator(wavefields[-1])
+    if mode >= 2 and deep_check:
+        with metrics.timer("validate.bp_check"):
+            code = bp_validator(os.path.join(runbase, "DATABASES_MPI",
+                                             sorted(wavefields)[-1]))
         if code != 0:
             err.code = 1
             err.new_status = statusobj.invalid_file
             err.msg = "bp validator failed"
-        bp_t = time.time() - _t
-        print("model files(bp) time:  %.1f" % bp_t)
         return err
 
     return Error(0, new_status=statusobj.done, msg="valid")
 
 
+@metrics.timed("validate.fingerprint")
+def get_run_fingerprint(runbase, save_forward, reference=None):
+    """
+    Fingerprint of files checked by validation: the size and mtime of
+    output_solver.txt, synthetic.h5, STATIONS and save_frame_at*.bp(if
+    save_forward), hashed into a sha1 string together with the
+    wavefield reference(if given, so verdicts checked against another
+    or no reference are not reused). Only stat calls are used.
+    """
+    paths = [os.path.join("OUTPUT_FILES", "output_solver.txt"),
+             os.path.join("OUTPUT_FILES", "synthetic.h5"),
+             os.path.join("DATA", "STATIONS")]
+    if save_forward:
+        for name in scan_wavefields(runbase):
+            paths.append(os.path.join("DATABASES_MPI", name))
+
+    items = [save_forward]
+    for path in sorted(paths):
+        try:
+            st = os.stat(os.path.join(runbase, path))
+            items.append((path, st.st_size, st.st_mtime))
+        except OSError:
+            items.append((path, None, None))
+    if save_forward and reference is not None:
+        items.append(sorted(reference["wavefields"].items()))
+    return hashlib.sha1(repr(items).encode("utf-8")).hexdigest()
+
+
+def check_run_progress(runbase, marks, stale_before=None,
+                       started_after=None):
+    """
+    Check if a run is newly finished, using only a stat of
+    output_solver.txt and, if it was modified since the mtime
+    high-water mark in marks({runbase: mtime}), a read of its tail.
+    A run is finished if "End of the simulation" is found, or if
+    output_solver.txt is not modified since stale_before(timestamp,
+    for runs that crashed). output_solver.txt not modified after
+    started_after(timestamp, if given) is left by an earlier run, so
+    it is ignored. Returns True if the run should be validated.
+    """
+    output_solver_txt = os.path.join(runbase, "OUTPUT_FILES",
+                                     "output_solver.txt")
+    try:
+        with metrics.timer("file.stat"):
+            mtime = os.stat(output_solver_txt).st_mtime
+    except OSError:
+        return False
+
+    if started_after is not None and mtime <= started_after:
+        return False
+
+    if mtime > marks.get(runbase, 0):
+        marks[runbase] = mtime
+        tail = read_file_tail(output_solver_txt)
+        if b"End of the simulation" in tail:
+            return True
+
+    return stale_before is not None and mtime < stale_before
+
+
+def utc_timestamp(dt):
+    """ POSIX timestamp of a naive UTC datetime(as stored in db) """
+    return calendar.timegm(dt.timetuple()) + dt.microsecond / 1.0e6
+
+
+def validate_solver(args):
+    """
+    Validate one solver, args = (solver_id, runbase, status,
+    save_forward, mode, cached, reference, deep_check, ncomponents).
+    It only takes and returns plain values, so it could be run in a
+    thread or process pool.
+
+    cached is the last verdict of the run from the validation cache,
+    as (fingerprint, mode, deep_check, status, msg), or None. If the
+    fingerprint of the run is unchanged and the cached verdict is at
+    least as deep(see is_cached_verdict_usable), the cached verdict is
+    used without validation.
+
+    Returns (solver_id, log, cache_record, snapshot), where log is
+    the dict of the Error(with the runbase), cache_record is the new
+    record for the validation cache(None if the cached verdict is
+    used) and snapshot is the metrics recorded(only if run in a worker
+    process, to be merged in the main process).
+    """
+    in_worker = metrics.is_worker_process()
+    if in_worker:
+        # forked workers inherit the metrics of the main process
+        metrics.METRICS.reset()
+
+    with metrics.timer("validate.solver"):
+        solver_id, log, cache_record = _validate_solver(args)
+    metrics.count("validate.solvers")
+    if cache_record is None:
+        metrics.count("validate.cached")
+
+    snapshot = None
+    if in_worker:
+        snapshot = metrics.METRICS.pop_snapshot()
+    return solver_id, log, cache_record, snapshot
+
+
+def is_cached_verdict_usable(cached, fingerprint, mode, deep_check):
+    """
+    True if the cached verdict has the same fingerprint and comes from
+    the same or a deeper mode. In mode 2 and 3, a verdict with the deep
+    check skipped is only used if the deep check is skipped again.
+    """
+    if cached is None or cached[0] != fingerprint or cached[1] < mode:
+        return False
+    return mode < 2 or not deep_check or bool(cached[2])
+
+
+def _validate_solver(args):
+    solver_id, runbase, status, save_forward, mode, cached, reference, \
+        deep_check, ncomponents = args
+    fingerprint = get_run_fingerprint(runbase, save_forward,
+                                      reference=reference)
+
+    if is_cached_verdict_usable(cached, fingerprint, mode, deep_check):
+        code = 0 if cached[3] == statusobj.done else 1
+        err = Error(code, new_status=cached[3], msg=cached[4])
+        cache_record = None
+    else:
+        solver = SolverInfo(solver_id, runbase, status)
+        err = validate_forward_simulation(
+            solver, save_forward, mode=mode, reference=reference,
+            deep_check=deep_check, ncomponents=ncomponents)
+        cache_record = {"runbase": runbase, "fingerprint": fingerprint,
+                        "mode": mode, "deep_check": deep_check,
+                        "status": err.new_status,
+                        "msg": err.msg, "checked_at": datetime.utcnow()}
+
+    err.old_status = status
+    log = err.to_dict()
+    log["runbase"] = runbase
+    log["cached"] = cache_record is None
+    return solver_id, log, cache_record
+
+
 class ForwardValidator(ForwardManager):
     """
     External validator to validate the jobs and change status in
     the table.
     """
-    def run(self, mode=1):
+    def run(self, mode=1, workers=1, executor="thread", force=False,
+            deep_sample=1.0):
         """
         mode 1: checks the existence of synthetic.h5
+        mode 2: also checks synthetic.h5(waveforms and stations in
+            STATIONS, with h5py if installed) and wavefield files with
+            bpls
+        mode 3: also scans the waveform data in synthetic.h5(requires
+            h5py and numpy)
+        If workers > 1, solvers are validated concurrently by a pool
+        of workers(executor is "thread" or "process"). Runs whose files
+        are unchanged since the last validation are skipped, unless
+        force. In mode 2, wavefield files are checked with bpls only
+        for a random sample(fraction deep_sample) of runs.
+        """
+        if mode >= 3 and (io.h5py is None or io.np is None):
+            raise ValueError("Validation mode 3 requires h5py and numpy")
+
+        runbase_info = self.config["runbase_info"]
+        status = check_forward_job(runbase_info["db_name"],
+                                   db_options=runbase_info.get("db_options"))
+
+        reference = self.load_wavefield_reference()
+        logfile = get_validation_log_file(runbase_info)
+        print("Log file: %s" % logfile)
+        with ValidationLogWriter(logfile) as logger:
+            for _s in status:
+                self.check_certain_job_status(
+                    _s, mode=mode, workers=workers, executor=executor,
+                    force=force, reference=reference,
+                    deep_sample=deep_sample, logger=logger)
+
+    def get_wavefield_reference_file(self):
+        return os.path.join(self.config["runbase_info"]["runbase"],
+                            WAVEFIELD_REFERENCE_FILE)
+
+    def load_wavefield_reference(self):
+        """
+        Load the reference of saved forward wavefields, or None if
+        save_forward is off or no reference is learned
+        """
+        fn = self.get_wavefield_reference_file()
+        if not self.config["simulation"]["save_forward"] or \
+                not os.path.exists(fn):
+            return None
+        print("Wavefield reference file: %s" % fn)
+        return load_json(fn)
+
+    def learn_wavefield_reference(self, run_dir=None):
+        """
+        Learn the reference of saved forward wavefields from run_dir,
+        or from the first solver validated as "Done" if run_dir is
+        None, and write it under runbase.
+        """
+        if run_dir is None:
+            entries = self.fetch_with_status(statusobj.done, num_to_fetch=1)
+            if len(entries) == 0:
+                raise ValueError("No solver with status(%s) to learn "
+                                 "the wavefield reference from"
+                                 % statusobj.done)
+            run_dir = entries[0][0].runbase
+
+        reference = learn_wavefield_reference(run_dir)
+        fn = self.get_wavefield_reference_file()
+        print("Learn wavefield reference(%d files) from: %s"
+              % (len(reference["wavefields"]), run_dir))
+        print("Wavefield reference file: %s" % fn)
+        dump_json(reference, fn)
+        return reference
+
+    @metrics.timed("db.fetch_cache")
+    def load_validation_cache(self, runbases):
+        """
+        Load cached verdicts of runbases, as {runbase: (fingerprint,
+        mode, deep_check, status, msg)}
+        """
+        cache = {}
+        session = self.Session()
+        try:
+            for _runbases in split_into_chunks(runbases, DB_CHUNK_SIZE):
+                query = session.query(
+                    ValidationCache.runbase, ValidationCache.fingerprint,
+                    ValidationCache.mode, ValidationCache.deep_check,
+                    ValidationCache.status,
+                    ValidationCache.msg).\
+                    filter(ValidationCache.runbase.in_(_runbases))
+                for row in query:
+                    cache[row[0]] = tuple(row[1:])
+        finally:
+            session.close()
+        return cache
+
+    @metrics.timed("db.update_cache")
+    def save_validation_cache(self, records):
+        """ Insert or replace records in the validation cache """
+        if len(records) == 0:
+            return
+        session = self.Session()
+        try:
+            session.execute(
+                ValidationCache.__table__.insert().prefix_with("OR REPLACE"),
+                records)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def make_validation_tasks(self, solvers, mode, force=False,
+                              reference=None, deep_sample=1.0):
+        """
+        Make the arguments of validate_solver for solvers(rows with
+        id, runbase and status), with their cached verdicts(unless
+        force)
         """
-        status = check_forward_job(self.config["runbase_info"]["db_name"])
-
-        log = {}
-        for _s in status:
-            _log = self.check_certain_job_status(_s, mode=mode)
-            log[_s] = _log
-
-        outputfn = "job_validator.log.json"
-        print("Log file: %s" % outputfn)
-        dump_json(log, outputfn)
-
-    def check_certain_job_status(self, job_status, mode=1):
-        entries = self.fetch_with_status(job_status)
-        print("=" * 20)
-        print("Number of items(%s): %d" % (job_status, len(entries)))
-
-        before = defaultdict(lambda: 0)
-        after = defaultdict(lambda: 0)
-        log = []
-
         save_forward = self.config["simulation"]["save_forward"]
-        for solver, _ in entries:
-            before[solver.status] += 1
-            # print("Solver: %s" % solver)
-            _err = validate_forward_simulation(solver, save_forward, mode=mode)
-            _err.old_status = solver.status
-            _log = _err.to_dict()
-            _log["runbase"] = solver.runbase
-            log.append(_log)
-            solver.status = _err.new_status
-            after[solver.status] += 1
-            # print("new status: %s" % solver.status)
-
-        print("status before: %s" % before)
-        print("status after:  %s" % after)
-        self.update_with_status(entries)
-
-        return log
+        ncomponents = self.config["simulation"].get(
+            "ncomponents", DEFAULT_NCOMPONENTS)
+        if force:
+            cache = {}
+        else:
+            cache = self.load_validation_cache(
+                [solver.runbase for solver in solvers])
+        return [(solver.id, solver.runbase, solver.status,
+                 save_forward, mode, cache.get(solver.runbase),
+                 reference, random.random() < deep_sample, ncomponents)
+                for solver in solvers]
+
+    def iter_validation_tasks(self, job_status, mode, force=False,
+                              reference=None, deep_sample=1.0,
+                              batch_size=DB_CHUNK_SIZE):
+        """
+        Iterate over the arguments of validate_solver for solvers with
+        job_status. Cached verdicts are loaded for each batch of
+        solvers(unless force).
+        """
+        solvers = []
+        for solver in self.iter_with_status(job_status):
+            solvers.append(solver)
+            if len(solvers) >= batch_size:
+                for task in self.make_validation_tasks(
+                        solvers, mode, force=force, reference=reference,
+                        deep_sample=deep_sample):
+                    yield task
+                solvers = []
+        for task in self.make_validation_tasks(
+                solvers, mode, force=force, reference=reference,
+                deep_sample=deep_sample):
+            yield task
+
+    def validate_tasks(self, tasks, workers=1, executor="thread",
+                       logger=None, flush_size=1000):
+        """
+        Run validate_solver on tasks and write the status back to
+        database(and the validation cache) in batches of flush_size.
+        The result of each solver is written to logger(if not None)
+        as soon as it is produced.
+        """
+        stats = {"before": defaultdict(lambda: 0),
+                 "after": defaultdict(lambda: 0),
+                 "nitems": 0, "ncached": 0, "nchanged": 0}
+        updates = []
+        cache_records = []
+        for solver_id, _log, cache_record, snapshot in parallel_map(
+                validate_solver, tasks, workers=workers, executor=executor):
+            if snapshot is not None:
+                metrics.METRICS.merge(snapshot)
+            stats["nitems"] += 1
+            stats["before"][_log["old_status"]] += 1
+            stats["after"][_log["new_status"]] += 1
+            if logger is not None:
+                logger.write(_log)
+            updates.append((solver_id, _log["new_status"]))
+            if cache_record is None:
+                stats["ncached"] += 1
+            else:
+                cache_records.append(cache_record)
+            # write results back in batches while validating
+            if len(updates) >= flush_size:
+                stats["nchanged"] += self.bulk_update_status(updates)
+                self.save_validation_cache(cache_records)
+                updates = []
+                cache_records = []
+        stats["nchanged"] += self.bulk_update_status(updates)
+        self.save_validation_cache(cache_records)
+        if logger is not None:
+            logger.flush()
+        return stats
+
+    def check_certain_job_status(self, job_status, mode=1, workers=1,
+                                 executor="thread", force=False,
+                                 reference=None, deep_sample=1.0,
+                                 logger=None, flush_size=1000):
+        """
+        Validate solvers with job_status and update their status.
+        Returns the number of solvers in each status after validation.
+        """
+        print("=" * 20)
+        print("Checking items(%s) with %d workers" % (job_status, workers))
+
+        tasks = self.iter_validation_tasks(
+            job_status, mode, force=force, reference=reference,
+            deep_sample=deep_sample)
+        stats = self.validate_tasks(tasks, workers=workers,
+                                    executor=executor, logger=logger,
+                                    flush_size=flush_size)
+
+        print("Number of items(%s): %d" % (job_status, stats["nitems"]))
+        print("Number of items unchanged since last validation: %d"
+              % stats["ncached"])
+        print("status before: %s" % dict(stats["before"]))
+        print("status after:  %s" % dict(stats["after"]))
+        print("Number of status changed in db: %d" % stats["nchanged"])
+
+        return dict(stats["after"])
+
+    def watch(self, mode=1, workers=1, executor="thread", interval=60,
+              stale_time_in_minutes=None, deep_sample=1.0, max_cycles=None):
+        """
+        Watch mode: every interval seconds, validate runs of solvers in
+        WATCH_STATUS which are newly finished(see check_run_progress)
+        since their solvers were claimed, and write their status back
+        to database. Only output_solver.txt
+        of the watched runs is checked, so the archive tree is never
+        walked. Runs whose output_solver.txt is not modified for
+        stale_time_in_minutes are also validated(if not None).
+
+        Stops after max_cycles(if not None), or cleanly on SIGINT or
+        SIGTERM after the current batch.
+        """
+        if mode >= 3 and (io.h5py is None or io.np is None):
+            raise ValueError("Validation mode 3 requires h5py and numpy")
+
+        stop_event = threading.Event()
+
+        def _stop(signum, frame):
+            print("Signal(%d) received, stopping..." % signum)
+            stop_event.set()
+
+        handlers = {}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            handlers[signum] = signal.signal(signum, _stop)
+
+        reference = self.load_wavefield_reference()
+        logfile = get_validation_log_file(self.config["runbase_info"])
+        print("Log file: %s" % logfile)
+        print("Watching status %s every %.1f seconds"
+              % (WATCH_STATUS, interval))
+
+        # mtime high-water marks of output_solver.txt, {runbase: mtime}
+        marks = {}
+        ncycles = 0
+        try:
+            with ValidationLogWriter(logfile) as logger:
+                while not stop_event.is_set():
+                    self.watch_cycle(
+                        marks, mode=mode, workers=workers, executor=executor,
+                        stale_time_in_minutes=stale_time_in_minutes,
+                        reference=reference, deep_sample=deep_sample,
+                        logger=logger, stop_event=stop_event)
+                    ncycles += 1
+                    if max_cycles is not None and ncycles >= max_cycles:
+                        break
+                    stop_event.wait(interval)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        print("Watch mode stopped after %d cycles" % ncycles)
+
+    def watch_cycle(self, marks, mode=1, workers=1, executor="thread",
+                    stale_time_in_minutes=None, reference=None,
+                    deep_sample=1.0, logger=None, stop_event=None,
+                    batch_size=DB_CHUNK_SIZE):
+        """
+        One cycle of watch mode. Returns the number of runs validated.
+        """
+        stale_before = None
+        if stale_time_in_minutes is not None:
+            stale_before = time.time() - stale_time_in_minutes * 60
+
+        pending = set()
+        finished = []
+        nvalidated = 0
+        for solver in self.iter_with_status(WATCH_STATUS):
+            pending.add(solver.runbase)
+            # the run could only be finished after its solver was
+            # claimed(runs of older claims have been overwritten)
+            started_after = None
+            if solver.claimed_at is not None:
+                started_after = utc_timestamp(solver.claimed_at)
+            if check_run_progress(solver.runbase, marks, stale_before,
+                                  started_after=started_after):
+                finished.append(solver)
+            if len(finished) >= batch_size:
+                nvalidated += self._validate_finished(
+                    finished, mode, workers, executor, reference,
+                    deep_sample, logger)
+                finished = []
+            if stop_event is not None and stop_event.is_set():
+                break
+        nvalidated += self._validate_finished(
+            finished, mode, workers, executor, reference, deep_sample,
+            logger)
+
+        # forget runs which are not watched any more
+        if stop_event is None or not stop_event.is_set():
+            for runbase in list(marks):
+                if runbase not in pending:
+                    del marks[runbase]
+
+        print("[%s] Watched runs: %d, validated: %d" % (
+            time.strftime("%Y-%m-%d %H:%M:%S"), len(pending), nvalidated))
+        return nvalidated
+
+    def _validate_finished(self, solvers, mode, workers, executor,
+                           reference, deep_sample, logger):
+        if len(solvers) == 0:
+            return 0
+        tasks = self.make_validation_tasks(
+            solvers, mode, reference=reference, deep_sample=deep_sample)
+        stats = self.validate_tasks(tasks, workers=workers,
+                                    executor=executor, logger=logger)
+        print("Validated %d runs: %s" % (stats["nitems"],
+                                          dict(stats["after"])))
+        return stats["nitems"]
@@ -14,6 +14,7 @@ from __future__ import print_function, division, absolute_import
 import os
 import re
 from .utils import check_exist, get_model_perturbation_string
+from .metrics import timed
 
 
 def extract_number_of_mpis(specfem_parfile):
@@ -203,6 +204,7 @@ def get_nnodes(config, specfemdir):
     return nmpis_per_job, nnodes_per_job
 
 
+@timed("job.template_render")
 def generate_lsf_script(template, outputfn, config, job_specfemdir):
     simul_type = config["simulation"]["type"]
     runbase_info = config["runbase_info"]
@@ -247,6 +249,7 @@ def generate_lsf_script(template, outputfn, config, job_specfemdir):
     print("Final job script: %s" % outputfn)
 
 
+@timed("job.template_render")
 def generate_pbs_script(template, outputfn, config, specfemdir,
                         model_perturb=None):
 
@@ -1,8 +1,22 @@
 from __future__ import print_function, division, absolute_import
+import os
 from subprocess import call
 import json
 import yaml
 
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# number of samples read at a time by scan_asdf_waveforms
+WAVEFORM_CHUNK_SIZE = 1048576
+
 
 def load_config(filename):
     """
@@ -14,6 +28,11 @@ def load_config(filename):
     return config
 
 
+def load_json(fn):
+    with open(fn) as fh:
+        return json.load(fh)
+
+
 def dump_json(content, fn):
     with open(fn, 'w') as fh:
         json.dump(content, fh, indent=2, sort_keys=True)
@@ -29,6 +48,18 @@ def read_txt_into_list(filename):
         return [x.rstrip() for x in fh]
 
 
+def iter_txt_lines(filename):
+    """
+    Iterate over the non-empty lines of a text file without loading
+    the whole file
+    """
+    with open(filename, "r") as fh:
+        for line in fh:
+            line = line.strip()
+            if len(line) > 0:
+                yield line
+
+
 def dump_list_to_txt(content, filename):
     with open(filename, 'w') as f:
         for line in content:
@@ -39,8 +70,8 @@ def bp_validator(fn):
     """
     Use command bpls to check bp file
     """
-    command = "bpls -latv %s &> /tmp/adios.tmp.log" % fn
-    code = call(command, shell=True)
+    with open(os.devnull, "w") as devnull:
+        code = call(["bpls", "-latv", fn], stdout=devnull, stderr=devnull)
     return code
 
 
@@ -48,6 +79,139 @@ def hdf5_validator(fn):
     """
     Use command hdf5 to check hdf5 file
     """
-    command = "h5dump -n %s &> /tmp/hdf5.tmp.log" % fn
-    code = call(command, shell=True)
+    with open(os.devnull, "w") as devnull:
+        code = call(["h5dump", "-n", fn], stdout=devnull, stderr=devnull)
     return code
+
+
+def read_station_names(stationfile):
+    """
+    Read the set of station names(NET.STA) from specfem STATIONS file,
+    with lines "STA NET LAT LON ELEVATION BURIAL". Malformed lines(
+    less than 2 fields) are skipped.
+    """
+    stations = set()
+    for line in iter_txt_lines(stationfile):
+        items = line.split()
+        if len(items) < 2:
+            continue
+        stations.add("%s.%s" % (items[1], items[0]))
+    return stations
+
+
+def read_asdf_station_names(fn):
+    """
+    Read the set of station names(NET.STA) in the "Waveforms" group of
+    asdf file. Returns None if h5py is not installed.
+    """
+    if h5py is None:
+        return None
+    with h5py.File(fn, "r") as fh:
+        if "Waveforms" not in fh:
+            return set()
+        return set(fh["Waveforms"].keys())
+
+
+def asdf_waveform_validator(fn, ncomponents=3):
+    """
+    Check the "Waveforms" group of asdf file in process(using h5py,
+    file opened read-only): each station group should have at least
+    ncomponents traces, and all traces should be non-empty datasets. If
+    h5py is not installed, fall back to hdf5_validator.
+
+    Returns (code, msg, info), where code is 0 if valid, msg is the
+    failure reason and info has the number of stations and traces.
+    """
+    if h5py is None:
+        if hdf5_validator(fn) != 0:
+            return 1, "hdf5 validator failed", None
+        return 0, "valid", None
+
+    nstations = 0
+    ntraces = 0
+    try:
+        with h5py.File(fn, "r") as fh:
+            if "Waveforms" not in fh:
+                return 1, "No Waveforms group in asdf file", None
+            for station, group in fh["Waveforms"].items():
+                nstations += 1
+                if not isinstance(group, h5py.Group):
+                    return 1, "Station %s is not a group" % station, None
+                traces = [name for name in group
+                          if name != "StationXML"]
+                if len(traces) < ncomponents:
+                    return 1, "Station %s has %d traces < %d" % (
+                        station, len(traces), ncomponents), None
+                for name in traces:
+                    trace = group[name]
+                    if not isinstance(trace, h5py.Dataset):
+                        return 1, "Trace %s is not a dataset" % name, None
+                    if trace.size == 0:
+                        return 1, "Empty trace: %s" % name, None
+                ntraces += len(traces)
+    except (IOError, OSError, KeyError, ValueError) as exc:
+        return 1, "Failed to read asdf file: %s" % exc, None
+
+    if nstations == 0:
+        return 1, "No station in asdf Waveforms group", None
+
+    return 0, "valid", {"nstations": nstations, "ntraces": ntraces}
+
+
+def scan_trace(dataset, chunk_size=WAVEFORM_CHUNK_SIZE):
+    """
+    Scan one trace(h5py dataset) in chunks. Returns (nonfinite, energy,
+    peak): whether it has NAN or INF values, the sum of squares and
+    the peak amplitude of the finite values.
+    """
+    nonfinite = False
+    energy = 0.0
+    peak = 0.0
+    for start in range(0, dataset.shape[0], chunk_size):
+        data = np.asarray(dataset[start:start+chunk_size],
+                          dtype=np.float64)
+        finite = np.isfinite(data)
+        if not finite.all():
+            nonfinite = True
+            data = data[finite]
+        if data.size > 0:
+            energy += float(np.dot(data, data))
+            peak = max(peak, float(np.abs(data).max()))
+    return nonfinite, energy, peak
+
+
+def scan_asdf_waveforms(fn, chunk_size=WAVEFORM_CHUNK_SIZE):
+    """
+    Scan all traces in the "Waveforms" group of asdf file, reading
+    chunk_size samples at a time, so memory usage is bounded. Returns
+    a compact summary: number of traces, names of traces with NAN/INF
+    values or zero energy, the peak amplitude and the min/max of
+    station peak amplitudes.
+    """
+    summary = {"ntraces": 0, "nonfinite_traces": [], "zero_traces": [],
+               "peak_amplitude": 0.0, "min_station_peak": None,
+               "max_station_peak": None}
+    station_peaks = []
+    with h5py.File(fn, "r") as fh:
+        if "Waveforms" not in fh:
+            return summary
+        for station, group in fh["Waveforms"].items():
+            station_peak = 0.0
+            for name in group:
+                if name == "StationXML":
+                    continue
+                nonfinite, energy, peak = scan_trace(group[name],
+                                                     chunk_size)
+                summary["ntraces"] += 1
+                if nonfinite:
+                    summary["nonfinite_traces"].append(name)
+                if energy == 0.0:
+                    summary["zero_traces"].append(name)
+                station_peak = max(station_peak, peak)
+            station_peaks.append(station_peak)
+
+    if len(station_peaks) > 0:
+        summary["peak_amplitude"] = max(station_peaks)
+        summary["min_station_peak"] = min(station_peaks)
+        summary["max_station_peak"] = max(station_peaks)
+    return summary
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Journal of forward job creation in JSON lines format. Each job is
+recorded as "planned"(with its claimed solvers) before anything is
+written, then each finished step("entry_dirs", "job_folder") and at
+last "completed". Records are synced to disk one by one, so after a
+crash the journal tells which jobs are unfinished and which of their
+steps could be skipped when resuming(see ForwardSolver.resume_jobs and
+ForwardSolver.rollback_jobs).
+"""
+from __future__ import print_function, division, absolute_import
+import os
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+
+# default journal file, relative to runbase
+DEFAULT_JOB_JOURNAL = "job_journal.jsonl"
+
+# steps of creating a job, in order
+JOB_STEPS = ["entry_dirs", "job_folder"]
+
+
+def get_job_journal_file(runbase_info):
+    """
+    Path of the job journal: runbase_info["job_journal"](relative path
+    is under runbase), or DEFAULT_JOB_JOURNAL under runbase
+    """
+    fn = runbase_info.get("job_journal", DEFAULT_JOB_JOURNAL)
+    return os.path.join(runbase_info["runbase"], fn)
+
+
+class JobJournal(object):
+    """ Append records to the job journal, each synced to disk """
+    def __init__(self, filename):
+        self.filename = filename
+        dirname = os.path.dirname(filename)
+        if dirname != "" and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.fh = open(filename, "a")
+
+    def record(self, event, job_dir, **kwargs):
+        record = dict(kwargs, event=event, job_dir=job_dir,
+                      timestamp=datetime.utcnow().strftime(
+                          "%Y-%m-%dT%H:%M:%S"))
+        self.fh.write(json.dumps(record, sort_keys=True) + "\n")
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+
+    def close(self):
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def load_job_states(filename):
+    """
+    Replay the journal into the latest state of each job dir:
+    {job_dir: {"state", "solver_ids", "owner", "steps"}}, in order of
+    planning. state is "planned", "completed" or "rolled_back". A job
+    dir planned again(by a later creation) starts over. Lines which
+    could not be parsed(the last line of a crash) are skipped.
+    """
+    states = OrderedDict()
+    if not os.path.exists(filename):
+        return states
+
+    with open(filename) as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            job_dir = record["job_dir"]
+            event = record["event"]
+            if event == "planned":
+                states.pop(job_dir, None)
+                states[job_dir] = {"state": "planned",
+                                   "solver_ids": record["solver_ids"],
+                                   "owner": record["owner"],
+                                   "steps": []}
+                continue
+            if job_dir not in states:
+                continue
+            job = states[job_dir]
+            if event == "resumed":
+                job["owner"] = record["owner"]
+            elif event == "step":
+                if record["step"] not in job["steps"]:
+                    job["steps"].append(record["step"])
+            elif event in ["completed", "rolled_back"]:
+                job["state"] = event
+    return states
+
+
+def get_unfinished_jobs(states):
+    """ Jobs planned but neither completed nor rolled back """
+    return OrderedDict((job_dir, job) for job_dir, job in states.items()
+                       if job["state"] == "planned")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Dry-run planning of forward job creation: the jobs(job dirs and the
+events of each serial run), file operations, bytes to copy, nodes and
+walltime are computed from the database and config, without claiming
+solvers or writing any file. The plan is saved as JSON, to be
+reviewed and executed later as it is(see
+ForwardSolver.create_jobs_from_plan).
+"""
+from __future__ import print_function, division, absolute_import
+import os
+import glob
+from datetime import datetime
+
+from .io import load_json, dump_json
+from .generate_batch_script import get_walltime, get_nnodes
+
+
+PLAN_VERSION = 1
+
+# specfem files copied into each job folder(see easy_copy_specfem)
+SPECFEM_FILES = ["bin/xspecfem3D", "OUTPUT_FILES/addressing.txt",
+                 "OUTPUT_FILES/values_from_mesher.h", "DATA/Par_file"]
+
+# mesher files copied into each entry dir(see setup_one_entry_dir)
+ENTRY_MESHER_FILES = ["values_from_mesher.h", "addressing.txt"]
+
+
+class FileOps(object):
+    """ Count of directories, files written, copied and linked """
+    def __init__(self):
+        self.dirs = 0
+        self.files_written = 0
+        self.copies = 0
+        self.links = 0
+        self.bytes_to_copy = 0
+        self.bytes_linked = 0
+        self.missing_files = []
+
+    def add_file(self, path, linked=False):
+        if not os.path.isfile(path):
+            self.missing_files.append(path)
+            return
+        size = os.path.getsize(path)
+        if linked:
+            self.links += 1
+            self.bytes_linked += size
+        else:
+            self.copies += 1
+            self.bytes_to_copy += size
+
+    def to_dict(self):
+        return {"dirs": self.dirs, "files_written": self.files_written,
+                "copies": self.copies, "links": self.links,
+                "bytes_to_copy": self.bytes_to_copy,
+                "bytes_linked": self.bytes_linked}
+
+
+def estimate_entry_ops(ops, cmtfile, stationfile, specfem_base, linked):
+    """ File operations of setup_one_entry_dir """
+    # runbase, DATA, OUTPUT_FILES and DATABASES_MPI
+    ops.dirs += 4
+    ops.add_file(cmtfile)
+    ops.add_file(stationfile)
+    for _file in ENTRY_MESHER_FILES:
+        ops.add_file(os.path.join(specfem_base, "OUTPUT_FILES", _file),
+                     linked=linked)
+
+
+def estimate_job_ops(ops, config, specfem_base, linked):
+    """ File operations of create_job_folder """
+    n_serial = config["job_config"]["n_serial"]
+    # job dir, specfem3d_globe and its DATA, bin, OUTPUT_FILES and
+    # DATABASES_MPI
+    ops.dirs += 6
+    # _XEVENTID.all, XEVENTID.*, config.yml and the job script
+    ops.files_written += n_serial + 3
+    for fn in SPECFEM_FILES:
+        ops.add_file(os.path.join(specfem_base, fn),
+                     linked=(linked and fn != "DATA/Par_file"))
+
+    if config["runbase_info"]["copy_model_to_sub_job_folder"]:
+        model_files = glob.glob(
+            os.path.join(specfem_base, "DATABASES_MPI", "*"))
+        for _file in model_files:
+            ops.add_file(_file, linked=linked)
+
+
+def make_forward_plan(config, job_dirs, job_entries, specfem_base):
+    """
+    Make the plan of forward jobs. job_entries is a list of (Solver,
+    Event) of each job, in the order they would be claimed.
+    """
+    n_serial = config["job_config"]["n_serial"]
+    n_simul = config["job_config"]["nevents_per_simul_run"]
+    store_mode = config["runbase_info"].get("artifact_store_mode")
+    linked = store_mode in ["hardlink", "symlink"]
+
+    nmpis_per_job, nnodes_per_job = get_nnodes(config, specfem_base)
+    walltime, _ = get_walltime(config)
+    walltime_in_min = \
+        config["job_config"]["walltime_per_simulation"] * n_serial
+
+    ops = FileOps()
+    jobs = []
+    for job_dir, entries in zip(job_dirs, job_entries):
+        estimate_job_ops(ops, config, specfem_base, linked)
+        for solver, event in entries:
+            estimate_entry_ops(ops, event.cmtfile, solver.stationfile,
+                               specfem_base, linked)
+
+        eventnames = [event.eventname for _, event in entries]
+        jobs.append({
+            "job_dir": job_dir,
+            "solver_ids": [solver.id for solver, _ in entries],
+            "serial_runs": [eventnames[idx*n_simul:(idx+1)*n_simul]
+                            for idx in range(n_serial)],
+            "runbases": [solver.runbase for solver, _ in entries]})
+
+    njobs = len(jobs)
+    return {
+        "version": PLAN_VERSION,
+        "created_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"),
+        "simulation_type": config["simulation"]["type"],
+        "config": config,
+        "specfem_base": specfem_base,
+        "artifact_store_mode": store_mode,
+        "njobs": njobs,
+        "nentries": sum(len(job["solver_ids"]) for job in jobs),
+        "nmpis_per_job": nmpis_per_job,
+        "nnodes_per_job": nnodes_per_job,
+        "walltime": walltime,
+        "totals": dict(ops.to_dict(),
+                       nodes=nnodes_per_job * njobs,
+                       node_hours=nnodes_per_job * njobs *
+                       walltime_in_min / 60.0),
+        "existing_job_dirs": [d for d in job_dirs if os.path.exists(d)],
+        "missing_files": sorted(set(ops.missing_files)),
+        "jobs": jobs}
+
+
+def print_plan(plan):
+    totals = plan["totals"]
+    print("Number of jobs and entries: %d, %d"
+          % (plan["njobs"], plan["nentries"]))
+    for job in plan["jobs"]:
+        print("  %s: %d entries, %d serial runs"
+              % (job["job_dir"], len(job["solver_ids"]),
+                 len(job["serial_runs"])))
+    print("Directories: %d; files written: %d" % (totals["dirs"],
+                                                   totals["files_written"]))
+    print("Files copied: %d(%.1f MB); files linked: %d(%.1f MB)"
+          % (totals["copies"], totals["bytes_to_copy"] / 1024.0**2,
+             totals["links"], totals["bytes_linked"] / 1024.0**2))
+    print("Nodes per job: %d; walltime per job: %s; total node hours: %.1f"
+          % (plan["nnodes_per_job"], plan["walltime"],
+             totals["node_hours"]))
+    if len(plan["existing_job_dirs"]) > 0:
+        print("Job dirs already exist: %s" % plan["existing_job_dirs"])
+    if len(plan["missing_files"]) > 0:
+        print("Missing files: %s" % plan["missing_files"])
+
+
+def dump_plan(plan, fn):
+    dump_json(plan, fn)
+
+
+def load_plan(fn):
+    """ Load the plan, and check it could be executed """
+    plan = load_json(fn)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError("Plan version(%s) not supported, should be %d"
+                         % (plan.get("version"), PLAN_VERSION))
+    if plan["simulation_type"] != "forward_simulation":
+        raise ValueError("Only forward simulation plans could be "
+                         "executed: %s" % plan["simulation_type"])
+    if len(plan["missing_files"]) > 0:
+        raise ValueError("Missing files in plan: %s"
+                         % plan["missing_files"])
+    return plan
@@ -154,6 +154,7 @@ class LineSearchSolver(ForwardManager):
                 setup_entry_dir(_entries, specfem_base)
                 create_job_folder(_dir, _entries, config, specfem_base,
                                   mp)
+                self.confirm_claims(_entries)
 
         # use the last mp job_dirs to copy the overall job script
         copy_overall_job_script(config, job_dirs)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+Named timers and counters for each stage(db fetch, file stat, txt
+parse, hdf5 check, ...), aggregated into histograms. A JSON summary
+is printed(to stderr) at the end of the bin commands(see with_metrics_summary),
+and appended to the file of environment variable SEISFORWARD_METRICS
+(if set).
+"""
+from __future__ import print_function, division, absolute_import
+import os
+import sys
+import json
+import time
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+
+# upper edges of histogram buckets of timers, in seconds
+TIMER_BUCKETS = [0.0001, 0.001, 0.01, 0.1, 1.0, 10.0, 100.0, 1000.0]
+
+
+class Histogram(object):
+    """ Count, sum, min, max and bucket counts of observed values """
+    def __init__(self, buckets=TIMER_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        idx = 0
+        while idx < len(self.buckets) and value > self.buckets[idx]:
+            idx += 1
+        self.counts[idx] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for idx, count in enumerate(other["counts"]):
+            self.counts[idx] += count
+        self.count += other["count"]
+        self.sum += other["sum"]
+        for key, func in (("min", min), ("max", max)):
+            if other[key] is not None:
+                value = getattr(self, key)
+                setattr(self, key, other[key] if value is None
+                        else func(value, other[key]))
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "min": self.min,
+                "max": self.max,
+                "mean": self.sum / self.count if self.count > 0 else None,
+                "counts": list(self.counts)}
+
+
+class Metrics(object):
+    """ Thread-safe registry of timers and counters """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if name not in self.timers:
+                self.timers[name] = Histogram()
+            self.timers[name].observe(seconds)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name):
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - t0)
+
+    def is_empty(self):
+        return len(self.timers) == 0 and len(self.counters) == 0
+
+    def snapshot(self):
+        with self.lock:
+            return {"timers": dict((name, hist.to_dict()) for name, hist
+                                   in self.timers.items()),
+                    "counters": dict(self.counters)}
+
+    def pop_snapshot(self):
+        """ Take the snapshot and reset """
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        """ Merge the snapshot taken in another process """
+        with self.lock:
+            for name, other in snapshot["timers"].items():
+                if name not in self.timers:
+                    self.timers[name] = Histogram()
+                self.timers[name].merge(other)
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """ Summary of all metrics, with histogram buckets labeled """
+        snapshot = self.snapshot()
+        labels = ["<=%gs" % b for b in TIMER_BUCKETS] + \
+            [">%gs" % TIMER_BUCKETS[-1]]
+        for hist in snapshot["timers"].values():
+            hist["histogram"] = dict(
+                (label, count) for label, count
+                in zip(labels, hist.pop("counts")) if count > 0)
+        return snapshot
+
+
+# metrics of the current process
+METRICS = Metrics()
+
+
+def timer(name):
+    return METRICS.timer(name)
+
+
+def count(name, value=1):
+    METRICS.count(name, value)
+
+
+def timed(name):
+    """ Decorator to time each call of a function with timer(name) """
+    def decorator(func):
+        @wraps(func)
+        def _func(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return _func
+    return decorator
+
+
+def is_worker_process():
+    """ True if running in a worker process of a process pool """
+    return multiprocessing.current_process().name != "MainProcess"
+
+
+def emit_metrics_summary(command=None):
+    """
+    Print the JSON summary of metrics to stderr(so it is not mixed
+    with the output of commands), and append it to the file of
+    environment variable SEISFORWARD_METRICS(if set)
+    """
+    if METRICS.is_empty():
+        return
+    if command is None:
+        command = os.path.basename(sys.argv[0])
+    summary = {"command": command,
+               "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"),
+               "metrics": METRICS.summary()}
+    print("Metrics summary:", file=sys.stderr)
+    print(json.dumps(summary, indent=2, sort_keys=True), file=sys.stderr)
+
+    fn = os.environ.get("SEISFORWARD_METRICS")
+    if fn:
+        with open(fn, "a") as fh:
+            fh.write(json.dumps(summary, sort_keys=True) + "\n")
+
+
+def with_metrics_summary(main):
+    """
+    Decorator of main functions of bin commands: time the command and
+    emit the metrics summary at the end(also if it fails)
+    """
+    @wraps(main)
+    def _main(*args, **kwargs):
+        try:
+            with timer("command.total"):
+                return main(*args, **kwargs)
+        finally:
+            emit_metrics_summary()
+    return _main
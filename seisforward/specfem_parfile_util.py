@@ -13,8 +13,10 @@
 from __future__ import print_function, division, absolute_import
 import os
 import re
+from .metrics import timed
 
 
+@timed("job.parfile_render")
 def modify_specfem_parfile(config, specfemdir):
 
     nevents_per_simul_run = config["job_config"]["nevents_per_simul_run"]
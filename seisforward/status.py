@@ -13,6 +13,7 @@ class Status(object):
         self.invalid_file = "InvalidFile"
         self.unstable_simulation = "UnstableSimulation"
         self.unfinished_simulation = "UnfinishedSimulation"
+        self.incomplete_output = "IncompleteOutput"
 
     def get_status(self):
         return sorted(self.__dict__.values())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Throughput report from the status transition history: number of
+finished and failed simulations, failure rates and the time solvers
+sit in "ReadytoLaunch", for each tag and time window.
+"""
+from __future__ import print_function, division, absolute_import
+from datetime import datetime, timedelta
+
+from . import statusobj
+from .db import Solver, StatusTransition
+from .utils import make_title
+
+
+# status regarded as failures of simulations
+FAILURE_STATUS = [statusobj.failed, statusobj.file_not_found,
+                  statusobj.invalid_file, statusobj.unstable_simulation,
+                  statusobj.unfinished_simulation,
+                  statusobj.incomplete_output]
+
+
+def iter_transitions(session, since=None, tag=None, batch_size=5000):
+    """
+    Iterate over (transition, solver tag) ordered by id(so by time),
+    page by page
+    """
+    last_id = 0
+    while True:
+        query = session.query(
+            StatusTransition.id, StatusTransition.solver_id,
+            StatusTransition.old_status, StatusTransition.new_status,
+            StatusTransition.timestamp, Solver.tag).\
+            join(Solver, Solver.id == StatusTransition.solver_id).\
+            filter(StatusTransition.id > last_id)
+        if since is not None:
+            query = query.filter(StatusTransition.timestamp >= since)
+        if tag is not None:
+            query = query.filter(Solver.tag == tag)
+        rows = query.order_by(StatusTransition.id).limit(batch_size).all()
+
+        for row in rows:
+            yield row
+
+        if len(rows) < batch_size:
+            break
+        last_id = rows[-1].id
+
+
+def get_window_start(timestamp, window):
+    seconds = (timestamp - datetime(1970, 1, 1)).total_seconds()
+    seconds = int(seconds // window.total_seconds() * window.total_seconds())
+    return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+
+
+def _new_window_stats():
+    return {"claimed": 0, "done": 0, "failed": 0,
+            "latency_count": 0, "latency_sum": 0.0, "latency_max": 0.0}
+
+
+def compute_status_report(session, window_in_minutes=60, since=None,
+                          tag=None):
+    """
+    Compute statistics for each tag and time window(of
+    window_in_minutes) from the status transition history:
+    1) claimed: number of solvers put into "ReadytoLaunch";
+    2) done: number of solvers validated as "Done", and the
+       throughput(done per hour);
+    3) failed: number of solvers validated as one of FAILURE_STATUS,
+       and the failure rate(failed / (done + failed));
+    4) queue latency: time(in hours) between a solver entering and
+       leaving "ReadytoLaunch", counted in the window it left.
+
+    Returns {tag: {window_start: stats}}, where solvers without tag are
+    grouped under "None".
+    """
+    window = timedelta(minutes=window_in_minutes)
+    report = {}
+    # time solvers entered ReadytoLaunch(only those still inside)
+    queued_since = {}
+
+    for row in iter_transitions(session, since=since, tag=tag):
+        _tag = str(row.tag)
+        window_start = get_window_start(row.timestamp, window).\
+            strftime("%Y-%m-%d %H:%M")
+        stats = report.setdefault(_tag, {}).setdefault(
+            window_start, _new_window_stats())
+
+        if row.old_status == statusobj.ready_to_launch and \
+                row.solver_id in queued_since:
+            latency = (row.timestamp - queued_since.pop(row.solver_id)).\
+                total_seconds() / 3600.0
+            stats["latency_count"] += 1
+            stats["latency_sum"] += latency
+            stats["latency_max"] = max(stats["latency_max"], latency)
+
+        if row.new_status == statusobj.ready_to_launch:
+            stats["claimed"] += 1
+            queued_since[row.solver_id] = row.timestamp
+        elif row.new_status == statusobj.done:
+            stats["done"] += 1
+        elif row.new_status in FAILURE_STATUS:
+            stats["failed"] += 1
+
+    window_in_hours = window_in_minutes / 60.0
+    for _tag in report:
+        for stats in report[_tag].values():
+            nvalidated = stats["done"] + stats["failed"]
+            stats["throughput_per_hour"] = stats["done"] / window_in_hours
+            stats["failure_rate"] = \
+                stats["failed"] / nvalidated if nvalidated > 0 else 0.0
+            latency_count = stats.pop("latency_count")
+            latency_sum = stats.pop("latency_sum")
+            stats["queue_latency_mean_in_hours"] = \
+                latency_sum / latency_count if latency_count > 0 else None
+            stats["queue_latency_max_in_hours"] = \
+                stats.pop("latency_max") if latency_count > 0 else None
+
+    return report
+
+
+def print_status_report(report):
+    for _tag in sorted(report):
+        print(make_title("Tag: %s" % _tag))
+        print("%-16s %8s %8s %8s %10s %8s %12s %12s" % (
+            "window", "claimed", "done", "failed", "done/hour",
+            "fail(%)", "latency(h)", "max lat.(h)"))
+        for window_start in sorted(report[_tag]):
+            stats = report[_tag][window_start]
+            latency = stats["queue_latency_mean_in_hours"]
+            max_latency = stats["queue_latency_max_in_hours"]
+            print("%-16s %8d %8d %8d %10.1f %8.1f %12s %12s" % (
+                window_start, stats["claimed"], stats["done"],
+                stats["failed"], stats["throughput_per_hour"],
+                stats["failure_rate"] * 100,
+                "-" if latency is None else "%.2f" % latency,
+                "-" if max_latency is None else "%.2f" % max_latency))
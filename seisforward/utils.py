@@ -2,9 +2,14 @@
 from __future__ import print_function, division, absolute_import
 import os
 import sys
+import errno
 import glob
 import shutil
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from . import metrics
 
 
 def timer(func):
@@ -19,8 +24,64 @@ def timer(func):
 
 
 def safe_makedir(dirname):
-    if not os.path.exists(dirname):
+    """
+    Make directory(and its parents) if not exists. Safe if it is made
+    by another thread or process at the same time.
+    """
+    try:
         os.makedirs(dirname)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST or not os.path.isdir(dirname):
+            raise
+
+
+def split_into_chunks(items, chunk_size):
+    """
+    Split a list into consecutive chunks with at most chunk_size items
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size should be >= 1: %d" % chunk_size)
+    return [items[idx:idx+chunk_size]
+            for idx in range(0, len(items), chunk_size)]
+
+
+def parallel_map(func, iterable, workers=1, executor="thread",
+                 max_pending=None):
+    """
+    Apply func to each item of iterable with a pool of workers(thread
+    or process pool), yielding results in the order of iterable. At
+    most max_pending(default 4 * workers) items are submitted ahead,
+    so the iterable is consumed lazily. If func raises, the pending
+    items are cancelled and the exception is re-raised.
+    """
+    if workers <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    if executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=workers)
+    elif executor == "process":
+        pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        raise ValueError("Unknown executor(%s), should be 'thread' or "
+                         "'process'" % executor)
+
+    if max_pending is None:
+        max_pending = 4 * workers
+
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
 
 
 def check_exist(filename):
@@ -65,7 +126,13 @@ def copyfile(origin_file, target_file, verbose=True):
 
     if verbose:
         print("Copy file:[%s --> %s]" % (origin_file, target_file))
-    shutil.copy2(origin_file, target_file)
+    # replace instead of writing into the target, which could be a
+    # link to a shared file(for example, an artifact store object)
+    if os.path.lexists(target_file):
+        os.remove(target_file)
+    with metrics.timer("file.copy"):
+        shutil.copy2(origin_file, target_file)
+    metrics.count("file.copy.files")
 
 
 def get_permission():
@@ -78,7 +145,19 @@ def get_permission():
         raise ValueError("answer incorrect: %s" % answer)
 
 
-def check_folders_exist(targetdir_list):
+# actions of check_folders_exist if folders exist
+FOLDER_EXIST_ACTIONS = ["ask", "remove", "abort"]
+
+
+def check_folders_exist(targetdir_list, action="ask"):
+    """
+    If any folder exists: ask whether to remove(clean) them or exit
+    (action "ask"), remove them without asking(action "remove") or
+    raise ValueError(action "abort")
+    """
+    if action not in FOLDER_EXIST_ACTIONS:
+        raise ValueError("Unknown action(%s), should be one of %s"
+                         % (action, FOLDER_EXIST_ACTIONS))
     clean_status = 1
     for targetdir in targetdir_list:
         if os.path.exists(targetdir):
@@ -86,8 +165,10 @@ def check_folders_exist(targetdir_list):
             clean_status = 0
 
     if clean_status == 0:
+        if action == "abort":
+            raise ValueError("Job folders exist already")
         print("Removed?")
-        if get_permission():
+        if action == "remove" or get_permission():
             for _dir in targetdir_list:
                 if os.path.exists(_dir):
                     cleantree(_dir)
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 from __future__ import print_function, division, absolute_import
 
+from .artifact_store import STORE_MODES
+
 
 def validate_config_srcinv(config):
     if "srcinv_info" not in config:
@@ -48,6 +50,27 @@ def validate_runbase_info(runbase_info):
         if key not in runbase_info:
             raise ValueError("Key(%s) not in config runbase_info" % key)
 
+    if not isinstance(runbase_info.get("db_options", {}), dict):
+        raise ValueError("db_options in config runbase_info should be a "
+                         "dict")
+
+    if runbase_info.get("lease_time_in_minutes", 1) <= 0:
+        raise ValueError("lease_time_in_minutes should be > 0")
+
+    mode = runbase_info.get("artifact_store_mode")
+    if mode is not None and mode not in STORE_MODES:
+        raise ValueError("artifact_store_mode(%s) in config runbase_info "
+                         "should be one of %s" % (mode, STORE_MODES))
+
+    if runbase_info.get("model_sync_workers", 1) < 1:
+        raise ValueError("model_sync_workers in config runbase_info should "
+                         "be >= 1")
+
+    for key in ["validation_log", "job_journal"]:
+        if not isinstance(runbase_info.get(key, ""), str):
+            raise ValueError("%s in config runbase_info should be a file "
+                             "path" % key)
+
 
 def validate_simulation_config(config):
     simul_type = config["type"]
@@ -61,6 +84,9 @@ def validate_simulation_config(config):
     if simul_type == "forward_simulation":
         if "save_forward" not in config:
             raise ValueError("Missing save_forward in forward simulation")
+        if config.get("ncomponents", 1) < 1:
+            raise ValueError("ncomponents in config simulation should be "
+                             ">= 1")
 
 
 def validate_config(config):
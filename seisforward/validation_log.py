@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Streaming validation log in JSON lines format: one result per line,
+appended as it is produced, so the log survives a crash halfway and
+could be filtered without loading the whole file.
+"""
+from __future__ import print_function, division, absolute_import
+import os
+import json
+import fnmatch
+from datetime import datetime
+
+
+# default validation log file, relative to runbase
+DEFAULT_VALIDATION_LOG = "validation_log.jsonl"
+
+
+def get_validation_log_file(runbase_info):
+    """
+    Path of the validation log: runbase_info["validation_log"](relative
+    path is under runbase), or DEFAULT_VALIDATION_LOG under runbase
+    """
+    fn = runbase_info.get("validation_log", DEFAULT_VALIDATION_LOG)
+    return os.path.join(runbase_info["runbase"], fn)
+
+
+class ValidationLogWriter(object):
+    """
+    Append records to the validation log. Records are flushed to disk
+    every flush_size records and when closed.
+    """
+    def __init__(self, filename, flush_size=100):
+        self.filename = filename
+        self.flush_size = flush_size
+        self.nrecords = 0
+        dirname = os.path.dirname(filename)
+        if dirname != "" and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.fh = open(filename, "a")
+
+    def write(self, record):
+        record = dict(record)
+        record.setdefault("timestamp",
+                          datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"))
+        self.fh.write(json.dumps(record, sort_keys=True) + "\n")
+        self.nrecords += 1
+        if self.nrecords % self.flush_size == 0:
+            self.fh.flush()
+
+    def flush(self):
+        self.fh.flush()
+
+    def close(self):
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_validation_log(filename, status=None, runbase=None):
+    """
+    Iterate over records in the validation log, line by line. Only
+    records with new_status in status(one status or a list) and
+    runbase matching runbase(a shell-style pattern) are yielded.
+    Lines which could not be parsed(for example, the last line written
+    by a crashed run) are skipped.
+    """
+    if status is not None and not isinstance(status, (list, tuple, set)):
+        status = [status]
+    # cheap substring test before parsing the line
+    status_keys = None
+    if status is not None:
+        status_keys = ['"new_status": %s' % json.dumps(s) for s in status]
+
+    with open(filename) as fh:
+        for line in fh:
+            if status_keys is not None and \
+                    not any(key in line for key in status_keys):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if status is not None and record.get("new_status") not in status:
+                continue
+            if runbase is not None and \
+                    not fnmatch.fnmatch(record.get("runbase", ""), runbase):
+                continue
+            yield record
+
+
+def iter_latest_records(records):
+    """
+    Keep only the latest record of each runbase(in order of their
+    last appearance)
+    """
+    latest = {}
+    for record in records:
+        latest.pop(record["runbase"], None)
+        latest[record["runbase"]] = record
+    for record in latest.values():
+        yield record
@@ -6,6 +6,10 @@ setup(
     packages=["seisforward"],
     zip_safe=False,
     install_requires=["pyyaml"],
+    extras_require={
+        # waveform and station checks of synthetic.h5 in validate_jobs
+        "hdf5": ["h5py", "numpy"],
+    },
     entry_points={
         'console_scripts':[
             'seisforward-validate_config=seisforward.bin.validate_config:main',
@@ -16,6 +20,9 @@ setup(
             'seisforward-validate_jobs=seisforward.bin.validate_jobs:main',
             'seisforward-check_job_status=seisforward.bin.check_job_status:main',  # NOQA
             'seisforward-reset_job_status=seisforward.bin.reset_job_status:main',  # NOQA
+            'seisforward-maintain_database=seisforward.bin.maintain_database:main',  # NOQA
+            'seisforward-report_status=seisforward.bin.report_status:main',  # NOQA
+            'seisforward-query_validation_log=seisforward.bin.query_validation_log:main',  # NOQA
         ]
     }
 )
@@ -0,0 +1,12 @@
+from __future__ import print_function, division, absolute_import
+import pytest
+
+from helpers import make_forward_config, reset_engines
+
+
+@pytest.fixture
+def forward_config(tmpdir):
+    """ Forward config with 13 "New" solvers(3 full jobs of 4) """
+    config = make_forward_config(str(tmpdir), nevents=13)
+    yield config
+    reset_engines()
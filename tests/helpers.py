@@ -0,0 +1,105 @@
+"""
+Helpers shared by tests: a fake specfem dir and a forward config with
+its database, and cleanup of the cached database engines
+"""
+from __future__ import print_function, division, absolute_import
+import os
+
+from sqlalchemy.orm import sessionmaker
+
+import seisforward.db as sfdb
+from seisforward.db import Event, Solver, create_db_engine
+from seisforward.bin.create_database import create_forward_db
+
+
+PARFILE = """SIMULATION_TYPE                 = 1
+SAVE_FORWARD                    = .false.
+NCHUNKS                         = 6
+NEX_XI                          = 256
+NEX_ETA                         = 256
+NPROC_XI                        = 4
+NPROC_ETA                       = 4
+MODEL                           = GLL
+ATTENUATION                     = .true.
+ABSORBING_CONDITIONS            = .false.
+RECORD_LENGTH_IN_MINUTES        = 10.0d0
+PARTIAL_PHYS_DISPERSION_ONLY    = .false.
+UNDO_ATTENUATION                = .true.
+NUMBER_OF_SIMULTANEOUS_RUNS     = 1
+BROADCAST_SAME_MESH_AND_MODEL   = .true.
+GPU_MODE                        = .true.
+ADIOS_ENABLED                   = .true.
+"""
+
+
+def reset_engines():
+    """
+    Drop the cached engines, without closing connections which may be
+    shared with the parent process(after fork)
+    """
+    for engine in sfdb._engines.values():
+        engine.dispose(close=False)
+    sfdb._engines.clear()
+
+
+def make_specfem(specfemdir):
+    for subdir in ["bin", "OUTPUT_FILES", "DATA", "DATABASES_MPI"]:
+        os.makedirs(os.path.join(specfemdir, subdir))
+    files = {"bin/xspecfem3D": "binary",
+             "OUTPUT_FILES/addressing.txt": "addressing",
+             "OUTPUT_FILES/values_from_mesher.h": "values",
+             "DATA/Par_file": PARFILE,
+             "DATABASES_MPI/topo.bin": "topo"}
+    for idx in range(4):
+        files["DATABASES_MPI/model_%d.bp" % idx] = "model"
+    for fn, content in files.items():
+        with open(os.path.join(specfemdir, fn), "w") as fh:
+            fh.write(content)
+
+
+def make_forward_config(root, nevents):
+    """
+    Runbase(with specfem), cmt and station files and a database with
+    nevents "New" solvers under root. Returns the config.
+    """
+    runbase = os.path.join(root, "runbase")
+    os.makedirs(os.path.join(runbase, "archive"))
+    make_specfem(os.path.join(runbase, "specfem3d_globe"))
+    for subdir in ["cmt", "sta"]:
+        os.makedirs(os.path.join(root, subdir))
+
+    db_name = os.path.join(root, "forward.db")
+    create_forward_db(db_name)
+    session = sessionmaker(bind=create_db_engine(db_name))()
+    for idx in range(nevents):
+        eventname = "E%05d" % idx
+        cmtfile = os.path.join(root, "cmt", eventname)
+        stationfile = os.path.join(root, "sta", "STATIONS.%s" % eventname)
+        with open(cmtfile, "w") as fh:
+            fh.write("cmt %s\n" % eventname)
+        with open(stationfile, "w") as fh:
+            fh.write("AAK II 42.6 74.5 1633.1 30.0\n")
+        solver = Solver(stationfile=stationfile, status="New",
+                        runbase=os.path.join(runbase, "archive", eventname))
+        solver.event = Event(eventname=eventname, cmtfile=cmtfile)
+        session.add(solver)
+    session.commit()
+    session.close()
+
+    return {
+        "simulation": {"type": "forward_simulation",
+                       "save_forward": False,
+                       "record_length_in_minutes": 10.0},
+        "runbase_info": {"db_name": db_name, "runbase": runbase,
+                         "job_folder_prefix": "t",
+                         "copy_model_to_sub_job_folder": False},
+        "job_config": {"n_serial": 2, "nevents_per_simul_run": 2,
+                       "walltime_per_simulation": 10},
+        "data_info": {"stationfolder": os.path.join(root, "sta"),
+                      "total_eventfile": os.path.join(root, "events"),
+                      "specfemdir": os.path.join(runbase,
+                                                 "specfem3d_globe"),
+                      "cmtfolder": os.path.join(root, "cmt")},
+        "user_info": {"email": "user@example.com"},
+        "batch_system": {"name": "lsf", "ngpu_per_node": 6,
+                         "nmpi_per_res": 1, "ncpu_per_res": 1}}
@@ -0,0 +1,33 @@
+from __future__ import print_function, division, absolute_import
+import pytest
+
+from seisforward import statusobj
+from seisforward.forward_validator import validate_synt_asdf_file
+
+h5py = pytest.importorskip("h5py")
+np = pytest.importorskip("numpy")
+
+
+def make_asdf(fn, components):
+    with h5py.File(fn, "w") as fh:
+        group = fh.create_group("Waveforms/II.AAK")
+        for comp in components:
+            group.create_dataset("II.AAK.MX%s" % comp, data=np.ones(10))
+    return fn
+
+
+def test_non_dataset_trace_is_invalid(tmpdir):
+    fn = make_asdf(str(tmpdir.join("synthetic.h5")), "ZNE")
+    with h5py.File(fn, "a") as fh:
+        fh["Waveforms/II.AAK"].create_group("II.AAK.MXR")
+
+    err = validate_synt_asdf_file(fn, mode=2)
+    assert err.new_status == statusobj.invalid_file
+    assert "not a dataset" in err.msg
+
+
+def test_number_of_components(tmpdir):
+    fn = make_asdf(str(tmpdir.join("synthetic.h5")), "Z")
+    err = validate_synt_asdf_file(fn, mode=2)
+    assert err.new_status == statusobj.invalid_file
+    assert validate_synt_asdf_file(fn, mode=2, ncomponents=1).code == 0
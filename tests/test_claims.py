@@ -0,0 +1,98 @@
+from __future__ import print_function, division, absolute_import
+import multiprocessing
+from datetime import timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from seisforward.db import Solver, create_db_engine
+from seisforward.forward_manager import ForwardManager
+
+from helpers import reset_engines
+
+
+def _claim_worker(config, n, queue):
+    reset_engines()
+    manager = ForwardManager(config)
+    ids = []
+    while True:
+        entries = manager.claim_batch(n)
+        if len(entries) == 0:
+            break
+        ids.extend(solver.id for solver, _ in entries)
+    queue.put(ids)
+
+
+def test_concurrent_claims_are_disjoint(forward_config):
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_claim_worker,
+                         args=(forward_config, 2, queue))
+             for _ in range(4)]
+    for proc in procs:
+        proc.start()
+    results = [queue.get(timeout=120) for _ in procs]
+    for proc in procs:
+        proc.join()
+        assert proc.exitcode == 0
+
+    ids = [_id for _ids in results for _id in _ids]
+    assert len(ids) == len(set(ids)) == 13
+
+
+def test_expired_claims_could_be_claimed_again(forward_config):
+    first = ForwardManager(forward_config)
+    first.lease_time = timedelta(minutes=-1)
+    entries = first.claim_batch(4)
+    assert len(entries) == 4
+
+    second = ForwardManager(forward_config)
+    second.owner = "otherhost:1"
+    reclaimed = second.claim_batch(4)
+    assert [s.id for s, _ in reclaimed] == [s.id for s, _ in entries]
+
+    # the first owner could not release claims taken over
+    assert first.release_claims(entries) == 0
+    assert second.confirm_claims(reclaimed) == 4
+    # confirmed claims are not re-claimable
+    assert [s.id for s, _ in second.claim_batch(4)] == [5, 6, 7, 8]
+
+
+def test_bulk_update_status_with_null_status(forward_config):
+    db_name = forward_config["runbase_info"]["db_name"]
+    session = sessionmaker(bind=create_db_engine(db_name))()
+    session.query(Solver).filter(Solver.id == 1).update({"status": None})
+    session.commit()
+    session.close()
+
+    manager = ForwardManager(forward_config)
+    assert manager.bulk_update_status([(1, "Running"), (2, "New")]) == 1
+    session = sessionmaker(bind=create_db_engine(db_name))()
+    assert session.query(Solver.status).filter(Solver.id == 1).scalar() \
+        == "Running"
+    session.close()
+
+
+def test_renew_and_confirm_claims(forward_config):
+    manager = ForwardManager(forward_config)
+    manager.lease_time = timedelta(minutes=-1)
+    entries = manager.claim_batch(4)
+
+    # expired claims still held are renewed
+    manager.lease_time = timedelta(minutes=10)
+    assert manager.renew_claims(entries) == 4
+    other = ForwardManager(forward_config)
+    other.owner = "otherhost:1"
+    assert [s.id for s, _ in other.claim_batch(2)] == [5, 6]
+
+    # a claim lost(reset) makes the confirmation fail as a whole
+    db_name = forward_config["runbase_info"]["db_name"]
+    session = sessionmaker(bind=create_db_engine(db_name))()
+    session.query(Solver).filter(Solver.id == 4).update(
+        {"status": "New", "owner": None, "lease_expires": None})
+    session.commit()
+    session.close()
+    assert manager.renew_claims(entries) == 3
+    assert manager.confirm_claims(entries) == 0
+    assert manager.confirm_claims(entries[:3]) == 3
+    # confirmed claims are not renewed(made re-claimable) again
+    assert manager.renew_claims(entries[:3]) == 0
@@ -0,0 +1,64 @@
+from __future__ import print_function, division, absolute_import
+import os
+import re
+
+import pytest
+
+from seisforward import forward_manager
+from seisforward.forward_manager import ForwardSolver
+from seisforward.io import read_txt_into_list
+from seisforward.job_journal import get_job_journal_file, load_job_states
+
+
+def get_job_base(config):
+    return os.path.join(config["runbase_info"]["runbase"], "jobs")
+
+
+def test_create_jobs_with_workers(forward_config, capsys):
+    ForwardSolver(forward_config).create_jobs(workers=3)
+
+    job_base = get_job_base(forward_config)
+    assert sorted(os.listdir(job_base)) == \
+        ["job_t_01", "job_t_02", "job_t_03"]
+    eventnames = []
+    for idx in range(3):
+        job_dir = os.path.join(job_base, "job_t_%02d" % (idx+1))
+        eventnames.extend(read_txt_into_list(
+            os.path.join(job_dir, "_XEVENTID.all")))
+    assert eventnames == ["E%05d" % idx for idx in range(12)]
+    archive = os.path.join(forward_config["runbase_info"]["runbase"],
+                           "archive")
+    for eventname in eventnames:
+        assert os.path.isfile(os.path.join(archive, eventname, "DATA",
+                                           "CMTSOLUTION"))
+
+    # progress is reported in order, whatever the order of workers
+    out = capsys.readouterr().out
+    assert re.findall(r"\[(\d+)/12\] (E\d+)", out) == \
+        [(str(idx+1), "E%05d" % idx) for idx in range(12)]
+    assert re.findall(r"Create job\[(\d)/3\]", out) == ["1", "2", "3"]
+
+    states = load_job_states(
+        get_job_journal_file(forward_config["runbase_info"]))
+    assert [job["state"] for job in states.values()] == ["completed"] * 3
+
+
+def test_create_jobs_worker_failure(forward_config, monkeypatch):
+    setup_one_entry_dir = forward_manager.setup_one_entry_dir
+
+    def _setup_one_entry_dir(solver, event, *args, **kwargs):
+        if event.eventname == "E00006":
+            raise IOError("Disk quota exceeded")
+        return setup_one_entry_dir(solver, event, *args, **kwargs)
+
+    monkeypatch.setattr(forward_manager, "setup_one_entry_dir",
+                        _setup_one_entry_dir)
+    with pytest.raises(IOError, match="Disk quota exceeded"):
+        ForwardSolver(forward_config).create_jobs(workers=3)
+
+    # no job completed, all left to be resumed or rolled back
+    states = load_job_states(
+        get_job_journal_file(forward_config["runbase_info"]))
+    assert [job["state"] for job in states.values()] == ["planned"] * 3
+    assert states[os.path.join(get_job_base(forward_config),
+                               "job_t_01")]["steps"] == ["entry_dirs"]
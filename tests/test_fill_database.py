@@ -0,0 +1,26 @@
+from __future__ import print_function, division, absolute_import
+import os
+
+from seisforward.bin.fill_database import bulk_load_entries
+
+
+def make_entry(root, eventname, cmtname=None):
+    return {"eventname": eventname,
+            "cmtfile": os.path.join(root, "cmt", cmtname or eventname),
+            "stationfile": os.path.join(root, "sta", "STATIONS"),
+            "runbase": os.path.join(root, "archive", eventname),
+            "tag": None}
+
+
+def test_entries_with_cmtfile_of_other_event_are_skipped(forward_config):
+    db_name = forward_config["runbase_info"]["db_name"]
+    root = os.path.dirname(db_name)
+    entries = [make_entry(root, "DUP", cmtname="E00000"),
+               make_entry(root, "NEW1"),
+               make_entry(root, "NEW2"),
+               make_entry(root, "DUP2", cmtname="NEW1")]
+
+    results = bulk_load_entries(db_name, entries, chunk_size=2)
+    assert results["duplicates"] == 2
+    assert results["events_inserted"] == results["solvers_inserted"] == 2
+    assert results["solvers_skipped"] == 2
@@ -0,0 +1,63 @@
+from __future__ import print_function, division, absolute_import
+import os
+import multiprocessing
+
+from seisforward.forward_manager import ForwardSolver, allocate_job_dirs
+from seisforward.io import read_txt_into_list
+
+from helpers import reset_engines
+
+
+def _allocate_worker(job_base, queue):
+    queue.put(allocate_job_dirs(job_base, "t", 5))
+
+
+def _create_jobs_worker(config, queue):
+    reset_engines()
+    ForwardSolver(config).create_jobs(max_jobs=1)
+    queue.put(True)
+
+
+def _run_processes(target, args, nprocs):
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=target, args=args + (queue,))
+             for _ in range(nprocs)]
+    for proc in procs:
+        proc.start()
+    results = [queue.get(timeout=120) for _ in procs]
+    for proc in procs:
+        proc.join()
+        assert proc.exitcode == 0
+    return results
+
+
+def test_allocate_job_dirs_after_existing(tmpdir):
+    job_base = str(tmpdir.join("jobs"))
+    os.makedirs(os.path.join(job_base, "job_t_01"))
+    os.makedirs(os.path.join(job_base, "job_t_05"))
+    os.makedirs(os.path.join(job_base, "job_other_09"))
+
+    job_dirs = allocate_job_dirs(job_base, "t", 2)
+    assert [os.path.basename(d) for d in job_dirs] == \
+        ["job_t_06", "job_t_07"]
+
+
+def test_concurrent_allocations_are_disjoint(tmpdir):
+    job_base = str(tmpdir.join("jobs"))
+    results = _run_processes(_allocate_worker, (job_base,), 4)
+    job_dirs = [d for _dirs in results for d in _dirs]
+    assert len(job_dirs) == len(set(job_dirs)) == 20
+    assert len(os.listdir(job_base)) == 20
+
+
+def test_concurrent_create_jobs_use_different_dirs(forward_config):
+    _run_processes(_create_jobs_worker, (forward_config,), 2)
+
+    job_base = os.path.join(forward_config["runbase_info"]["runbase"],
+                            "jobs")
+    assert sorted(os.listdir(job_base)) == ["job_t_01", "job_t_02"]
+    events = [read_txt_into_list(os.path.join(job_base, d, "_XEVENTID.all"))
+              for d in os.listdir(job_base)]
+    assert len(events[0]) == len(events[1]) == 4
+    assert len(set(events[0]) | set(events[1])) == 8
@@ -0,0 +1,168 @@
+from __future__ import print_function, division, absolute_import
+import os
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from seisforward import forward_manager
+from seisforward.db import Solver, create_db_engine
+from seisforward.forward_manager import ForwardSolver
+from seisforward.job_journal import JobJournal, get_job_journal_file, \
+    load_job_states, get_unfinished_jobs
+
+
+def get_job_base(config):
+    return os.path.join(config["runbase_info"]["runbase"], "jobs")
+
+
+def get_status(config):
+    db_name = config["runbase_info"]["db_name"]
+    session = sessionmaker(bind=create_db_engine(db_name))()
+    status = dict((row[0], (row[1], row[2])) for row in session.query(
+        Solver.id, Solver.status, Solver.lease_expires))
+    session.close()
+    return status
+
+
+@pytest.fixture
+def failed_creation(forward_config, monkeypatch):
+    """
+    Job creation which failed at the folder of the second job(of 3),
+    so the first job is completed and the other two are unfinished
+    """
+    create_job_folder = forward_manager.create_job_folder
+
+    def _create_job_folder(job_dir, *args, **kwargs):
+        if job_dir.endswith("_02"):
+            raise IOError("Disk quota exceeded")
+        return create_job_folder(job_dir, *args, **kwargs)
+
+    monkeypatch.setattr(forward_manager, "create_job_folder",
+                        _create_job_folder)
+    with pytest.raises(IOError):
+        ForwardSolver(forward_config).create_jobs()
+    monkeypatch.setattr(forward_manager, "create_job_folder",
+                        create_job_folder)
+    return forward_config
+
+
+def make_other_creator(config):
+    """ Another job creator than the failed one """
+    manager = ForwardSolver(config)
+    manager.owner = "otherhost:1"
+    return manager
+
+
+def test_load_job_states_skips_partial_line(tmpdir):
+    fn = str(tmpdir.join("journal.jsonl"))
+    with JobJournal(fn) as journal:
+        journal.record("planned", "job_1", owner="a:1", solver_ids=[1, 2])
+        journal.record("planned", "job_2", owner="a:1", solver_ids=[3, 4])
+        journal.record("step", "job_1", step="entry_dirs")
+        journal.record("completed", "job_1")
+    with open(fn, "a") as fh:
+        fh.write('{"event": "step", "job_dir": "job_2", "st')
+
+    states = load_job_states(fn)
+    assert states["job_1"]["state"] == "completed"
+    assert states["job_2"] == {"state": "planned", "solver_ids": [3, 4],
+                               "owner": "a:1", "steps": []}
+    assert list(get_unfinished_jobs(states)) == ["job_2"]
+
+
+def test_failed_creation_keeps_claims(failed_creation):
+    states = load_job_states(
+        get_job_journal_file(failed_creation["runbase_info"]))
+    assert [job["state"] for job in states.values()] == \
+        ["completed", "planned", "planned"]
+    for job in list(states.values())[1:]:
+        assert job["steps"] == ["entry_dirs"]
+    status = get_status(failed_creation)
+    assert all(status[_id] == ("ReadytoLaunch", None) for _id in range(1, 5))
+    assert all(status[_id][0] == "ReadytoLaunch" and status[_id][1]
+               for _id in range(5, 13))
+
+
+def test_resume_needs_expired_lease_or_force(failed_creation, monkeypatch):
+    manager = make_other_creator(failed_creation)
+    # unexpired claims of the failed creator are not taken over
+    assert manager.resume_jobs() == 0
+
+    nentries = []
+    monkeypatch.setattr(forward_manager, "setup_one_entry_dir",
+                        lambda *args, **kwargs: nentries.append(1))
+    assert manager.resume_jobs(force=True) == 2
+    # entry dirs were set up before the failure
+    assert len(nentries) == 0
+
+    job_base = get_job_base(failed_creation)
+    for job_dir in ["job_t_02", "job_t_03"]:
+        assert os.path.exists(os.path.join(job_base, job_dir,
+                                           "_XEVENTID.all"))
+    status = get_status(failed_creation)
+    assert all(status[_id] == ("ReadytoLaunch", None) for _id in range(1, 13))
+    assert status[13] == ("New", None)
+    assert manager.resume_jobs() == 0
+
+
+def test_rollback_releases_unfinished_jobs(failed_creation):
+    manager = make_other_creator(failed_creation)
+    job_base = get_job_base(failed_creation)
+
+    assert manager.rollback_jobs() == 0
+    assert sorted(os.listdir(job_base)) == \
+        ["job_t_01", "job_t_02", "job_t_03"]
+
+    assert manager.rollback_jobs(force=True) == 8
+    assert sorted(os.listdir(job_base)) == ["job_t_01"]
+    status = get_status(failed_creation)
+    assert all(status[_id] == ("New", None) for _id in range(5, 14))
+    assert manager.rollback_jobs(force=True) == 0
+
+
+def test_rollback_keeps_confirmed_jobs(failed_creation):
+    # the creator crashed after confirming the claims of the second
+    # job, before "completed" was written into the journal
+    db_name = failed_creation["runbase_info"]["db_name"]
+    session = sessionmaker(bind=create_db_engine(db_name))()
+    session.query(Solver).filter(Solver.id.between(5, 8)).\
+        update({"lease_expires": None}, synchronize_session=False)
+    session.commit()
+    session.close()
+
+    manager = make_other_creator(failed_creation)
+    assert manager.rollback_jobs(force=True) == 4
+    assert sorted(os.listdir(get_job_base(failed_creation))) == \
+        ["job_t_01", "job_t_02"]
+    states = load_job_states(
+        get_job_journal_file(failed_creation["runbase_info"]))
+    assert [job["state"] for job in states.values()] == \
+        ["completed", "completed", "rolled_back"]
+
+
+def test_lost_claims_stop_creation(forward_config, monkeypatch):
+    create_job_folder = forward_manager.create_job_folder
+    db_name = forward_config["runbase_info"]["db_name"]
+
+    def _create_job_folder(job_dir, entries, *args, **kwargs):
+        create_job_folder(job_dir, entries, *args, **kwargs)
+        if job_dir.endswith("_02"):
+            # claims of the job taken over by another creator
+            session = sessionmaker(bind=create_db_engine(db_name))()
+            session.query(Solver).filter(Solver.id == entries[0][0].id).\
+                update({"owner": "otherhost:1"})
+            session.commit()
+            session.close()
+
+    monkeypatch.setattr(forward_manager, "create_job_folder",
+                        _create_job_folder)
+    with pytest.raises(ValueError):
+        ForwardSolver(forward_config).create_jobs()
+
+    states = load_job_states(
+        get_job_journal_file(forward_config["runbase_info"]))
+    assert [job["state"] for job in states.values()] == \
+        ["completed", "planned", "planned"]
+    status = get_status(forward_config)
+    # none of the claims of the second job is confirmed
+    assert all(status[_id][1] for _id in range(5, 9))
@@ -0,0 +1,51 @@
+from __future__ import print_function, division, absolute_import
+import os
+
+import pytest
+from sqlalchemy import text
+
+from seisforward.db import create_db_engine, SCHEMA_VERSION
+from seisforward.forward_manager import ForwardSolver
+
+from helpers import reset_engines
+
+
+def set_schema_version(db_name, version):
+    with create_db_engine(db_name).begin() as conn:
+        conn.execute(text("PRAGMA user_version = %d" % version))
+    reset_engines()
+
+
+def get_db_files(db_name):
+    """ Size and mtime of the database and its journal files """
+    files = {}
+    for suffix in ["", "-wal", "-shm", "-journal"]:
+        if os.path.exists(db_name + suffix):
+            st = os.stat(db_name + suffix)
+            files[suffix] = (st.st_size, st.st_mtime)
+    return files
+
+
+def test_plan_jobs_writes_nothing(forward_config):
+    db_name = forward_config["runbase_info"]["db_name"]
+    reset_engines()
+    before = get_db_files(db_name)
+
+    plan = ForwardSolver(forward_config, readonly=True).plan_jobs()
+    assert plan["njobs"] == 3
+    assert [job["solver_ids"] for job in plan["jobs"]] == \
+        [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12]]
+    assert get_db_files(db_name) == before
+    assert not os.path.exists(
+        os.path.join(forward_config["runbase_info"]["runbase"], "jobs"))
+
+
+def test_plan_jobs_needs_upgraded_schema(forward_config):
+    db_name = forward_config["runbase_info"]["db_name"]
+    set_schema_version(db_name, SCHEMA_VERSION - 1)
+
+    with pytest.raises(ValueError, match="maintain_database"):
+        ForwardSolver(forward_config, readonly=True)
+    with create_db_engine(db_name).connect() as conn:
+        assert conn.execute(text("PRAGMA user_version")).scalar() == \
+            SCHEMA_VERSION - 1